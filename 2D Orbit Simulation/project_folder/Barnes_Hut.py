@@ -0,0 +1,215 @@
+import numpy as np
+from Vectorised_Grav import *
+
+"""
+Barnes-Hut approximation of the gravitational field. The masses are sorted along a
+Z-order (Morton) curve so that every node of the quadtree is a contiguous run of the
+sorted masses, which lets the whole tree be built and walked a level at a time with
+array operations rather than a Python object per node.
+Bodies are pulled a leaf of up to leaf_size at a time, so the walk handles (leaf, node)
+pairs rather than (body, node) pairs. A node is treated as a single mass, with its
+quadrupole, once its reach (the furthest of its bodies from its centre of mass) plus the
+leaf's extent is less than theta times their distance apart, otherwise it is opened; its
+field is then expanded about the leaf's centre to second order, unless the node holds
+much of the mass, when it is taken at each body. Nearby leaves are summed directly.
+theta = 0 reproduces the direct sum, larger values trade accuracy for speed. """
+
+# Spreads the low 32 bits of each integer out so that they occupy the even bits
+def spread_bits(x):
+    x = x & 0xffffffff
+    x = (x | x << 16) & 0x0000ffff0000ffff
+    x = (x | x << 8) & 0x00ff00ff00ff00ff
+    x = (x | x << 4) & 0x0f0f0f0f0f0f0f0f
+    x = (x | x << 2) & 0x3333333333333333
+    x = (x | x << 1) & 0x5555555555555555
+    return x
+
+
+class Quadtree:
+    max_depth = 20
+    leaf_size = 8                    # Bodies a node may hold before it is split
+    max_block = 2**20                # Pairs of bodies held at once in the near field sums
+    heavy = 0.01                     # Share of the mass above which a far node is taken body by body
+    def __init__(self, s, m):
+        self.s, self.m = s, m
+        D = Quadtree.max_depth
+        self.lo = s.min(axis=0)
+        self.width = max((s.max(axis=0) - self.lo).max(), 1e-300)*(1 + 1e-12)
+        cells = np.minimum(((s - self.lo)/self.width*2**D).astype(np.int64), 2**D - 1)
+        keys = spread_bits(cells[:,0]) << 1 | spread_bits(cells[:,1])
+        self.order = np.argsort(keys, kind="stable")
+        self.build(keys[self.order])
+
+    # One level at a time: bodies sharing a node with more than leaf_size - 1 others are
+    # split into the four quadrants of that node for the next level down.
+    def build(self, keys):
+        D = Quadtree.max_depth
+        s, m = self.s[self.order], self.m[self.order]
+        levels = []
+        active = np.arange(len(keys))
+        for level in range(D + 1):
+            if active.size == 0: break
+            prefix = keys[active] >> 2*(D - level)
+            new_node = np.ones(active.size, dtype=bool)
+            new_node[1:] = (prefix[1:] != prefix[:-1]) | (active[1:] != active[:-1] + 1)
+            first = np.flatnonzero(new_node)
+            count = np.diff(np.append(first, active.size))
+            mass = np.add.reduceat(m[active], first)
+            com = np.add.reduceat(s[active]*m[active,np.newaxis], first)/mass[:,np.newaxis]
+            # Second moments about the centre of mass, for the quadrupole
+            x, y = s[active,0] - np.repeat(com[:,0], count), s[active,1] - np.repeat(com[:,1], count)
+            moments = np.column_stack([np.add.reduceat(m[active]*w, first) for w in (x*x, x*y, y*y)])
+            # The furthest any of its bodies lies from the centre of mass
+            reach = np.sqrt(np.maximum.reduceat(x*x + y*y, first))
+            leaf = (count <= Quadtree.leaf_size) | (level == D)
+            levels.append((active[first], count, mass, com, moments, reach, np.full(first.size, level), leaf))
+            active = active[np.repeat(~leaf, count)]
+        self.start, self.count, self.mass, self.com, self.moments, self.reach, self.level, self.leaf = \
+            [np.concatenate(column) for column in zip(*levels)]
+        # Children of a node are the nodes one level down whose first body lies inside it
+        offsets = np.cumsum([0] + [len(l[0]) for l in levels])
+        self.first_child = np.zeros(len(self.start), dtype=np.int64)
+        self.n_children = np.zeros(len(self.start), dtype=np.int64)
+        for L in range(len(levels) - 1):
+            parents = slice(offsets[L], offsets[L+1])
+            starts = self.start[offsets[L+1]:offsets[L+2]]
+            lo = np.searchsorted(starts, self.start[parents])
+            hi = np.searchsorted(starts, self.start[parents] + self.count[parents])
+            self.first_child[parents] = offsets[L+1] + lo
+            self.n_children[parents] = np.where(self.leaf[parents], 0, hi - lo)
+        # The leaves in Z-order split the sorted bodies into runs, the groups pulled together
+        self.leaves = np.flatnonzero(self.leaf)
+        self.leaves = self.leaves[np.argsort(self.start[self.leaves])]
+        self.group_of = np.repeat(np.arange(len(self.leaves)), self.count[self.leaves])
+        lo = np.minimum.reduceat(s, self.start[self.leaves])
+        hi = np.maximum.reduceat(s, self.start[self.leaves])
+        self.center, self.extent = (lo + hi)/2, np.hypot(*(hi - lo).T)/2
+
+    # Every leaf group of bodies walks the tree at once, a level at a time. A node is taken
+    # as a point mass for the whole group when its reach plus the group's extent is less
+    # than theta times the distance between them. A leaf which can't be taken that way is
+    # summed body by body. Returns the (group, node) pairs of each kind.
+    def interactions(self, theta, groups):
+        far, near = [], []
+        gi, ni = groups, np.zeros(len(groups), dtype=np.int64)
+        g_start = self.start[self.leaves]
+        (cx, cy), (mx, my) = self.center.T, self.com.T
+        while gi.size:
+            dx, dy = mx[ni] - cx[gi], my[ni] - cy[gi]
+            start = g_start[gi] - self.start[ni]
+            inside = (start >= 0) & (start < self.count[ni])
+            accept = ~inside & ((self.reach[ni] + self.extent[gi])**2 < theta**2*(dx*dx + dy*dy))
+            far.append((gi[accept], ni[accept]))
+            rest = ~accept & self.leaf[ni]
+            near.append((gi[rest], ni[rest]))
+            gi, ni = gi[~accept & ~self.leaf[ni]], ni[~accept & ~self.leaf[ni]]
+            n = self.n_children[ni]
+            offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            gi = np.repeat(gi, n)
+            ni = np.repeat(self.first_child[ni], n) + offset
+        return [np.concatenate(column) for column in zip(*far)], \
+               [np.concatenate(column) for column in zip(*near)]
+
+    # The field of each node at e = (ex, ey) from its centre of mass, as the point mass
+    # a = -G*M*e/r^3 and the quadrupole a = G*(3Pe/r^5 - tr(P)e/r^5 - 5qe/2r^7), with
+    # q = 3e.Pe - tr(P)r^2 and P the second moments, then the potential. Given derivatives,
+    # the point mass's first and second derivatives come between the two.
+    def multipole(self, G, nodes, ex, ey, derivatives=False):
+        inv_r2 = 1/(ex*ex + ey*ey)
+        inv_r = np.sqrt(inv_r2)
+        inv_r3 = inv_r*inv_r2
+        inv_r5 = inv_r3*inv_r2
+        GM = G*self.mass[nodes]
+        a, tidal, quad = GM*inv_r3, 3*GM*inv_r5, 3*G*inv_r5
+        Pxx, Pxy, Pyy = (column[nodes] for column in self.moments.T)
+        trace = Pxx + Pyy
+        Pe_x, Pe_y = Pxx*ex + Pxy*ey, Pxy*ex + Pyy*ey
+        q = 3*(ex*Pe_x + ey*Pe_y) - trace/inv_r2
+        radial = a + G*inv_r5*(trace + 2.5*q*inv_r2)
+        terms = [quad*Pe_x - radial*ex, quad*Pe_y - radial*ey]
+        if derivatives:
+            ux, uy = 5*ex*ex*inv_r2, 5*ey*ey*inv_r2
+            terms += [tidal*ex*ex - a, tidal*ex*ey, tidal*ey*ey - a,
+                      tidal*ex*(3 - ux), tidal*ey*(1 - ux), tidal*ex*(1 - uy), tidal*ey*(3 - uy)]
+        return terms + [-GM*inv_r - 0.5*G*q*inv_r5]
+
+    # Far nodes: the field of each and its derivatives at the centre of the group, summed
+    # over the group's nodes, give every body in it the field to second order in its offset
+    # from the centre. Nodes holding more than heavy of all the mass would dominate the
+    # error of that expansion, so they are taken body by body. Near leaves are summed
+    # pair by pair.
+    # Given potential, the targets' potentials are left in it from the same interactions.
+    def accelerations(self, G, theta, targets=None, potential=None):
+        N, n_leaves = len(self.s), len(self.leaves)
+        s, m = self.s[self.order], self.m[self.order]
+        groups = np.arange(n_leaves) if targets is None else \
+                 np.unique(self.group_of[np.argsort(self.order)[targets]])
+        (fg, fn), (ng, nn) = self.interactions(theta, groups)
+        (cx, cy), (mx, my) = self.center.T, self.com.T
+        heavy = self.mass[fn] > Quadtree.heavy*self.mass[0]
+        g, n = fg[~heavy], fn[~heavy]
+        field = [np.bincount(g, weights=w, minlength=n_leaves)[self.group_of]
+                 for w in self.multipole(G, n, cx[g] - mx[n], cy[g] - my[n], derivatives=True)]
+        ax, ay, xx, xy, yy, xxx, xxy, xyy, yyy, phi = field
+        ox, oy = (s - self.center[self.group_of]).T
+        acc = np.column_stack((ax + xx*ox + xy*oy + 0.5*(xxx*ox*ox + 2*xxy*ox*oy + xyy*oy*oy),
+                               ay + xy*ox + yy*oy + 0.5*(xxy*ox*ox + 2*xyy*ox*oy + yyy*oy*oy)))
+        phi = phi - ax*ox - ay*oy - 0.5*(xx*ox*ox + 2*xy*ox*oy + yy*oy*oy)
+        # Heavy nodes, at every body of the group
+        g, n = fg[heavy], fn[heavy]
+        count = self.count[self.leaves][g]
+        i = np.repeat(self.start[self.leaves][g], count) + \
+            np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        n = np.repeat(n, count)
+        heavy_field = [np.bincount(i, weights=w, minlength=N)
+                       for w in self.multipole(G, n, s[i,0] - mx[n], s[i,1] - my[n])]
+        acc += np.column_stack(heavy_field[:2])
+        phi += heavy_field[2]
+        # Near leaves: every pair of bodies between the group and the leaf, in blocks of
+        # pairs whose group and leaf hold the same numbers of bodies, so nothing is padded
+        near = np.zeros((N, 3))
+        group_start, group_count = self.start[self.leaves][ng], self.count[self.leaves][ng]
+        leaf_start, leaf_count = self.start[nn], self.count[nn]
+        shape = group_count*(leaf_count.max(initial=0) + 1) + leaf_count
+        by_shape = np.argsort(shape, kind="stable")
+        bounds = np.flatnonzero(np.diff(shape[by_shape])) + 1
+        for pairs in np.split(by_shape, bounds):
+            if pairs.size == 0: continue
+            a, b = group_count[pairs[0]], leaf_count[pairs[0]]
+            block = max(1, Quadtree.max_block//(a*b))
+            for lo in range(0, len(pairs), block):
+                p = pairs[lo:lo+block]
+                i = group_start[p,np.newaxis] + np.arange(a)
+                j = leaf_start[p,np.newaxis] + np.arange(b)
+                dx = s[j,0][:,np.newaxis] - s[i,0][:,:,np.newaxis]
+                dy = s[j,1][:,np.newaxis] - s[i,1][:,:,np.newaxis]
+                r2 = dx**2 + dy**2
+                r2[r2 == 0] = np.inf
+                inv_r = m[j][:,np.newaxis]/np.sqrt(r2)
+                w = inv_r/r2
+                for c, value in enumerate(((dx*w).sum(axis=2), (dy*w).sum(axis=2), -inv_r.sum(axis=2))):
+                    near[:,c] += np.bincount(i.ravel(), weights=value.ravel(), minlength=N)
+        acc += G*near[:,:2]
+        phi += G*near[:,2]
+        result, potentials = np.empty((N,2)), np.empty(N)
+        result[self.order], potentials[self.order] = acc, phi
+        if targets is None: targets = np.arange(N)
+        if potential is not None: potential[:] = potentials[targets]
+        return result[targets]
+
+
+"""
+Barnes_Hut_Gravitation replaces the pairwise g_vectors/resultant_g of Vectorised_Gravitation
+with a tree walk, so the N x N arrays are never built. """
+
+class Barnes_Hut_Gravitation(Vectorised_Gravitation):
+    pairwise = False
+    theta = 0.5                      # Opening angle, 0 gives the direct sum
+    def __init__(self, main, integrator=None, collisions=None):
+        assert Barnes_Hut_Gravitation.theta >= 0
+        super().__init__(main, integrator, collisions)
+
+    def accelerations(self, s, rows=None):
+        self.tree = Quadtree(s, self.m)
+        return self.tree.accelerations(self.main.G, self.theta, targets=rows,
+                                       potential=self.potential_out(s, rows))
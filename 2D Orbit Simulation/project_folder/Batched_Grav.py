@@ -0,0 +1,168 @@
+import numpy as np
+from Vectorised_Grav import *
+
+"""
+Batched_Gravitation steps B independent systems together, for ensembles of small systems
+where the Python overhead of each step costs far more than its arithmetic. The systems
+are stacked along a leading axis, so s, v and gR are (B, N, 2) and m is (B, N), where N
+is the size of the largest system. Smaller systems are padded with massless slots which
+mask marks as empty. Every phase, and the force pass inside each integrator, is then one
+array operation over the whole batch.
+main.input is a list of systems (lists of Mass instances) rather than a single system.
+Collisions are found with the same LIMIT test as Vectorised_Gravitation and only between
+masses in the same system. A merged mass takes the slot of the first mass in its cluster
+and the others are emptied, so no system ever moves to a different row.
+The integrators which track state per mass (Wisdom_Holman, Block_Leapfrog) aren't
+supported, nor is Collision_Queue. """
+
+class Batched_Gravitation(Vectorised_Gravitation):
+    s = v = gR = m = D = density = None     # Plain arrays here rather than the registry's
+    def __init__(self, main, integrator=None, collisions=None):
+        assert collisions is None
+        super().__init__(main, integrator)
+        assert not isinstance(self.integrator, (Wisdom_Holman, Block_Leapfrog))
+
+    def initialise_data_structures(self):
+        self.map, self.p_total = {}, []
+        self.dT = self.time_step*self.main.TIME_LAPSE
+        systems = self.current_system
+        B, N = len(systems), max([len(system) for system in systems] + [1])
+        self.mask = np.zeros((B,N), dtype=bool)
+        self.ID = np.full((B,N), -1, dtype=np.int64)
+        self.s, self.v, self.gR = np.zeros((B,N,2)), np.zeros((B,N,2)), np.zeros((B,N,2))
+        self.m, self.D, self.density = np.zeros((B,N)), np.zeros((B,N)), np.zeros((B,N))
+        self.colour = np.zeros((B,N,3), dtype=np.uint8)
+        for b, system in enumerate(systems):
+            k = len(system)
+            self.mask[b,:k] = True
+            self.ID[b,:k] = [n.ID for n in system]
+            self.s[b,:k] = [n.s for n in system]
+            self.v[b,:k] = [n.v for n in system]
+            self.m[b,:k] = [n.m for n in system]
+            self.D[b,:k] = [n.real_diameter for n in system]
+            self.density[b,:k] = [n.avg_density for n in system]
+            self.colour[b,:k] = [n.colour for n in system]
+        # Merged masses are numbered on from the largest ID in their own system
+        self.next_ID = self.ID.max(axis=1) + 1
+        self.merged_into = [{} for _ in systems]
+        self.merge_events = []           # (system, ID of the new mass, IDs it was made from)
+        self.gR_current = False
+        self.r, self.r_mag, self.g = None, None, None
+
+    # Pairs of masses in the same system, i != j
+    def pair_mask(self):
+        pair = self.mask[:,:,np.newaxis] & self.mask[:,np.newaxis,:]
+        pair[:, np.arange(pair.shape[1]), np.arange(pair.shape[1])] = False
+        return pair
+
+    # 1.
+    def mass_network(self):
+        pass
+
+    # 3. r[b,i,j] points from mass i to mass j of system b
+    def r_vectors(self):
+        self.r = self.s[:,np.newaxis,:,:] - self.s[:,:,np.newaxis,:]
+
+    # 4.
+    def R_mag(self):
+        self.r_mag = np.sqrt(self.r[...,0]**2 + self.r[...,1]**2)
+
+    # 5.
+    def g_vectors(self):
+        if self.gR_current: return
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_r3 = np.where(self.pair_mask(), 1/self.r_mag**3, 0)
+        self.g = self.main.G*self.r*(self.m[:,np.newaxis,:]*inv_r3)[...,np.newaxis]
+
+    # 6.
+    def resultant_g(self):
+        if not self.gR_current:
+            self.gR = self.g.sum(axis=2)
+
+    def accelerations(self, s, rows=None):
+        assert rows is None
+        r = s[:,np.newaxis,:,:] - s[:,:,np.newaxis,:]
+        r_mag = np.sqrt(r[...,0]**2 + r[...,1]**2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_r3 = np.where(self.pair_mask(), 1/r_mag**3, 0)
+        return self.main.G*(r*(self.m[:,np.newaxis,:]*inv_r3)[...,np.newaxis]).sum(axis=2)
+
+    # 8.
+    def reposition(self):
+        self.integrator.reposition(self, self.dT)
+
+    def collision_reach(self):
+        w = np.abs(self.v) + np.abs(self.gR)*self.dT
+        return 0.5*self.D + 0.5 + np.hypot(w[...,0], w[...,1])*self.dT
+
+    # 9. As Vectorised_Gravitation.remove_collided, returning (b, i, j) with i < j
+    def remove_collided(self):
+        reach = self.collision_reach()
+        near = self.pair_mask() & (self.r_mag <= reach[:,:,np.newaxis] + reach[:,np.newaxis,:])
+        b, i, j = np.nonzero(np.triu(near, 1))
+        distance = self.r_mag[b, i, j]
+        vf = np.abs(self.v[b,i]) + np.abs(self.v[b,j]) + \
+             (np.abs(self.gR[b,i]) + np.abs(self.gR[b,j]))*self.dT
+        vf_mag = np.hypot(vf[:,0], vf[:,1])
+        total_dist = self.D[b,i] + self.D[b,j]
+        del_threshold = (0.5*self.D[b,i] + 0.5*self.D[b,j])/total_dist
+        LIMIT = del_threshold + vf_mag*self.dT
+        hit = distance <= LIMIT
+        return b[hit], i[hit], j[hit]
+
+    # 10. Clusters are found over the flattened (system, slot) index, which can't join
+    #     masses from different systems as only pairs within a system are passed in.
+    def assymilate(self):
+        b, i, j = self.remove_collided()
+        if len(b) == 0: return
+        N = self.mask.shape[1]
+        roots = helper_functions.clusters(zip((b*N + i).tolist(), (b*N + j).tolist()))
+        idx = np.array(sorted(roots))
+        cluster = np.unique([roots[k] for k in idx], return_inverse=True)[1]
+        bi, ki = np.divmod(idx, N)
+        m = self.m[bi,ki]
+        m_final = np.bincount(cluster, weights=m)
+        p = np.column_stack([np.bincount(cluster, weights=m*self.v[bi,ki,k]) for k in range(2)])
+        ms = np.column_stack([np.bincount(cluster, weights=m*self.s[bi,ki,k]) for k in range(2)])
+        density = np.bincount(cluster, weights=m*self.density[bi,ki])
+        by_mass = np.lexsort((-m, cluster))
+        heaviest = by_mass[np.flatnonzero(np.diff(np.append(-1, cluster[by_mass])))]
+        colours = self.colour[bi[heaviest],ki[heaviest]]
+        # idx is sorted, so the first member of each cluster is its lowest slot
+        first = np.unique(cluster, return_index=True)[1]
+        bs, ks = bi[first], ki[first]
+        new_ID = np.empty(len(first), dtype=np.int64)
+        for c, system in enumerate(bs.tolist()):
+            new_ID[c] = self.next_ID[system]
+            self.next_ID[system] += 1
+        old_ID = self.ID[bi,ki]
+        for ID, c in zip(old_ID.tolist(), cluster.tolist()):
+            if ID == self.main.center_object_ID: new_ID[c] = ID
+        for system, ID, c in zip(bi.tolist(), old_ID.tolist(), cluster.tolist()):
+            self.merged_into[system][ID] = int(new_ID[c])
+        for c in range(len(first)):
+            self.merge_events.append((int(bs[c]), int(new_ID[c]), old_ID[cluster == c].tolist()))
+        self.mask[bi,ki], self.m[bi,ki], self.v[bi,ki], self.gR[bi,ki] = False, 0, 0, 0
+        self.mask[bs,ks], self.ID[bs,ks], self.colour[bs,ks] = True, new_ID, colours
+        self.m[bs,ks], self.density[bs,ks] = m_final, density/m_final
+        self.v[bs,ks], self.s[bs,ks] = p/m_final[:,np.newaxis], ms/m_final[:,np.newaxis]
+        self.D[bs,ks] = 2*(3*m_final/(4*math.pi*self.density[bs,ks]))**(1/3)
+        self.gR_current = False
+        self.r_vectors()
+        self.R_mag()
+
+    # Total energy of each system
+    def energies(self):
+        kinetic = 0.5*(self.m*(self.v**2).sum(axis=2)).sum(axis=1)
+        r = self.s[:,np.newaxis,:,:] - self.s[:,:,np.newaxis,:]
+        r_mag = np.sqrt(r[...,0]**2 + r[...,1]**2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_r = np.where(self.pair_mask(), 1/r_mag, 0)
+        potential = -0.5*self.main.G*(self.m[:,:,np.newaxis]*self.m[:,np.newaxis,:]*inv_r).sum(axis=(1,2))
+        return kinetic + potential
+
+    # The masses left in system b, in the same form as ensemble results
+    def final_state(self, b):
+        k = self.mask[b]
+        return {"ID": self.ID[b,k].tolist(), "m": self.m[b,k].tolist(),
+                "s": self.s[b,k].tolist(), "v": self.v[b,k].tolist()}
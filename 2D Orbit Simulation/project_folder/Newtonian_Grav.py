@@ -1,4 +1,5 @@
 from mass import *
+import itertools
 import helper_functions
 
 """
@@ -8,8 +9,10 @@ structures for the next calculation. """
 
 class Gravitation:
     time_step = 5000                 # Default 5000 seconds per frame 
+    max_time_step = 10**4            # First order updates drift beyond this
+    monitor = None                   # Conservation_Monitor (diagnostics.py), which asks for merges to be accounted
     def __init__(self,main):
-        assert Gravitation.time_step > 0 and Gravitation.time_step <= 10**4
+        assert self.time_step > 0 and self.time_step <= self.max_time_step
         self.main = main
         assert self.main.TIME_LAPSE >=0 and self.main.TIME_LAPSE <= 1
         self.current_system = main.input
@@ -17,8 +20,11 @@ class Gravitation:
 
     def initialise_data_structures(self):
         self.map, self.p_total = {}, []
-        self.dT = Gravitation.time_step*self.main.TIME_LAPSE
-        self.removed, self.rem_ids, self.new_ids, self.new_system = [],[],[],[]
+        self.dT = self.time_step*self.main.TIME_LAPSE
+        self.removed, self.new_system = [],[]
+        self.merged_into = {}            # {ID of a merged mass : ID of the mass it became}
+        # Change in total energy and angular momentum made by merges, while monitored
+        self.merge_energy, self.merge_angular_momentum = 0, 0
 
     # 1. Creating a method which ientidies all mass instances surrounding the current 
     # mass. A dictionary / self.map contains {mass : surrounding masses} elements.
@@ -37,10 +43,7 @@ class Gravitation:
     # Mass.others data structure, creating a 'gravitational network' of mass instances
     def get_neighbours(self):
         for n in self.map:
-            others = []
-            for i in self.map[n]:
-                others.append(i)
-            n.others=others
+            n.others = self.map[n]
 
     # 3. 
     def r_vectors(self):
@@ -61,8 +64,9 @@ class Gravitation:
                 result.append(dist)
             n.r_mag = result
 
-    # 5. 
+    # 5. Each mass's potential is added up alongside when a monitor is about to measure
     def g_vectors(self):
+        potential = self.monitor is not None and self.monitor.due
         for n in self.current_system:
             result = []
             if len(n.others) > 0:
@@ -71,6 +75,7 @@ class Gravitation:
                     gy = round(self.main.G*n.others[k].m*n.r[k][1]/(n.r_mag[k]**3),10)
                     result.append([gx,gy])
             n.g = result
+            if potential: n.phi = -sum(self.main.G*k.m/r for k, r in zip(n.others, n.r_mag))
 
     # 6. 
     def resultant_g(self):
@@ -99,9 +104,6 @@ class Gravitation:
                 sx += n.s[0] + n.v[0]*self.dT 
                 sy += n.s[1] + n.v[1]*self.dT 
                 n.s = [sx,sy]
-                n.screen_points = helper_functions.pygame_array([n.s[0]], [n.s[1]], 
-                                                                self.main.screen_width, 
-                                                                self.main.screen_height)
 
 
     """
@@ -114,71 +116,102 @@ class Gravitation:
     objects to accelrate through one another / false gravitational slingshots. The following resolve this.
     """
 
+    # Broadphase for remove_collided. Each mass can reach half its diameter plus the distance
+    # its closing speed could carry it this step (plus half a metre, as del_threshold below
+    # always works out at 0.5). Masses are hashed into square cells twice the largest reach
+    # wide, so only masses in the same or neighbouring cells can touch.
+    def collision_candidates(self):
+        reach, grid, pairs = {}, {}, []
+        for n in self.current_system:
+            gRx, gRy = (abs(n.gR[0]), abs(n.gR[1])) if len(n.gR) == 2 else (0, 0)
+            margin = ((abs(n.v[0]) + gRx*self.dT)**2 + (abs(n.v[1]) + gRy*self.dT)**2)**0.5*self.dT
+            reach[n] = 0.5*n.real_diameter + 0.5 + margin
+        if len(reach) < 2: return pairs
+        cell = 2*max(reach.values())
+        for ind, n in enumerate(self.current_system):
+            key = (math.floor(n.s[0]/cell), math.floor(n.s[1]/cell))
+            grid.setdefault(key, []).append((ind, n))
+        for (kx, ky), members in grid.items():
+            for dx, dy in ((0,0), (1,-1), (1,0), (1,1), (0,1)):
+                neighbours = grid.get((kx+dx, ky+dy), [])
+                for i, n in members:
+                    for j, other in neighbours:
+                        if (dx, dy) == (0,0) and j <= i: continue
+                        distance = math.hypot(n.s[0]-other.s[0], n.s[1]-other.s[1])
+                        if distance <= reach[n] + reach[other]:
+                            pairs.append((n, other, distance))
+        return pairs
+
     # 9. The following method will allow the the machine to differentiate between 
-    #    collided masses and other masses. 
+    #    collided masses and other masses. Returns the pairs which have collided.
     def remove_collided(self):
-        removed,new = [],[]
-        for n in self.current_system:
-            for distance in n.r_mag:
-                ind = n.r_mag.index(distance)
-                size_other = n.others[ind].real_diameter
-                total_dist = n.real_diameter + size_other
-                """
-                Modification I)
-                Originally calculated closing velocity magnitude without resulant gravity magnitudes.
-                This modification doesn't make a great deal of apparent difference but just adds to the 
-                function's mass removal capability"""
-                gRx, gRy= 0,0
-                if (len(n.gR) and len(n.others[ind].gR)) == 2:
-                    gRx = abs(n.gR[0]) + abs(n.others[ind].gR[0])
-                    gRy = abs(n.gR[1]) + abs(n.others[ind].gR[1])
-                vf_x = abs(n.v[0]) + abs(n.others[ind].v[0]) + gRx*self.dT   # v = v0 + g*t
-                vf_y = abs(n.v[1]) + abs(n.others[ind].v[1]) + gRy*self.dT
-                vf_mag = (vf_x**2 +vf_y**2)**0.5                             # Closing velocity
-                del_threshold = (0.5*n.real_diameter + 0.5*size_other)/total_dist
-                LIMIT = del_threshold + vf_mag*self.dT                       # s = s0 + v*t
-                if distance <= LIMIT: 
-                    removed.append(n) 
-            if n in removed: pass 
-            else: new.append(n)   
-        return removed, new
+        collided = []
+        for n, other, distance in self.collision_candidates():
+            size_other = other.real_diameter
+            total_dist = n.real_diameter + size_other
+            """
+            Modification I)
+            Originally calculated closing velocity magnitude without resulant gravity magnitudes.
+            This modification doesn't make a great deal of apparent difference but just adds to the 
+            function's mass removal capability"""
+            gRx, gRy= 0,0
+            if len(n.gR) == 2 and len(other.gR) == 2:
+                gRx = abs(n.gR[0]) + abs(other.gR[0])
+                gRy = abs(n.gR[1]) + abs(other.gR[1])
+            vf_x = abs(n.v[0]) + abs(other.v[0]) + gRx*self.dT   # v = v0 + g*t
+            vf_y = abs(n.v[1]) + abs(other.v[1]) + gRy*self.dT
+            vf_mag = (vf_x**2 +vf_y**2)**0.5                             # Closing velocity
+            del_threshold = (0.5*n.real_diameter + 0.5*size_other)/total_dist
+            LIMIT = del_threshold + vf_mag*self.dT                       # s = s0 + v*t
+            if distance <= LIMIT: 
+                collided.append((n, other))
+        return collided
  
     # 10.
     # The physical attrubutes of the removed masses to calculate the those of a new mass
     # which will replace the removed ones ready for the next itteration. 
-    # The new mass will appear on screen as the resulting outcome of the collided masses
+    # The new mass will appear on screen as the resulting outcome of the collided masses.
+    # Collided pairs are first grouped into clusters, so separate collisions in the same
+    # step give separate new masses.
     def assymilate(self):
-        removed, new = self.remove_collided()
-        rem_pos_x, rem_pos_y = [n.s[0] for n in removed], [n.s[1] for n in removed]
-        if len(removed) > 0:
-            masses_collected = [n.m for n in removed]
-            ind = masses_collected.index(max(masses_collected))
-            self.substitute_colour = removed[ind].colour
-            m_final = 0
-            density = 0
-            px,py = 0,0
-            sx,sy = 0,0
+        roots = helper_functions.clusters(self.remove_collided())
+        if len(roots) == 0: return
+        groups = {}
+        for n in self.current_system:
+            if n in roots: groups.setdefault(roots[n], []).append(n)
+        new = [n for n in self.current_system if n not in roots]
+        system = list(self.current_system)
+        for removed in groups.values():
+            m_final = sum(n.m for n in removed)
+            density = sum(n.avg_density*n.m for n in removed)
+            px, py = sum(n.m*n.v[0] for n in removed), sum(n.m*n.v[1] for n in removed)
+            sx, sy = sum(n.m*n.s[0] for n in removed), sum(n.m*n.s[1] for n in removed)
+            self.substitute_colour = max(removed, key=lambda n: n.m).colour
+            M = Mass(m=m_final, s=[sx/m_final, sy/m_final], v=[px/m_final, py/m_final],
+                     colour=self.substitute_colour, avg_density=density/m_final)
+            for n in removed:
+                if n.ID == self.main.center_object_ID: M.ID = self.main.center_object_ID
             for n in removed:
-                m_final += n.m
-                density += n.avg_density*n.m 
-                px += n.m*n.v[0]
-                py += n.m*n.v[1]
-                for i in n.others:
-                    if i in removed: 
-                        mass_ratio = i.m/(n.m+i.m) 
-                        sx += n.s[0]*(1-mass_ratio)   
-                        sy += n.s[1]*(1-mass_ratio)
-                p_final= [px,py]
-                v_final = [n/m_final for n in p_final]  
-                avg_density = density/m_final
-                if sx >=min(rem_pos_x) and sx<max(rem_pos_x):
-                    if sy >=min(rem_pos_y) and sy<max(rem_pos_y):
-                        s_final = [sx,sy]
-                        new.append(Mass(m=m_final, s=s_final, v=v_final, colour = self.substitute_colour, 
-                                        avg_density = avg_density))
-                        for n in removed: 
-                            if n.ID == self.main.center_object_ID:
-                                new[-1].ID = self.main.center_object_ID
-                        self.rem_ids = [n.ID for n in removed]
-                        self.new_ids = [n.ID for n in new]
-                        self.current_system = new
+                self.merged_into[n.ID] = M.ID
+            if self.monitor is not None:
+                # Clusters are merged one after another, each into what the last left
+                dE, dL = self.merge_change(system, removed, M)
+                self.merge_energy += dE
+                self.merge_angular_momentum += dL
+                system = [n for n in system if n not in removed] + [M]
+            new.append(M)
+        self.current_system = new
+
+    # Change in total energy and angular momentum when the masses in removed, out of
+    # system, become the single mass M. Only the terms involving them change.
+    def merge_change(self, system, removed, M):
+        G = self.main.G
+        kinetic = lambda n: 0.5*n.m*(n.v[0]**2 + n.v[1]**2)
+        angular = lambda n: n.m*(n.s[0]*n.v[1] - n.s[1]*n.v[0])
+        potential = lambda a, b: -G*a.m*b.m/math.hypot(a.s[0]-b.s[0], a.s[1]-b.s[1])
+        rest = [n for n in system if n not in removed]
+        before = sum(kinetic(n) for n in removed) + \
+                 sum(potential(a, b) for a, b in itertools.combinations(removed, 2)) + \
+                 sum(potential(n, k) for n in removed for k in rest)
+        after = kinetic(M) + sum(potential(M, k) for k in rest)
+        return after - before, angular(M) - sum(angular(n) for n in removed)
@@ -0,0 +1,127 @@
+import os
+import weakref
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from Vectorised_Grav import *
+
+"""
+Direct sum spread over several cores, for systems too large for one core but not yet
+large enough for Barnes_Hut to pay off. Positions, masses, the rows asked for and the
+resulting accelerations live in multiprocessing.shared_memory blocks. A persistent pool
+of worker processes maps them once and each force pass only sends every worker the
+(start, stop) of its tiles of rows, so no array is ever pickled. Each tile writes its own
+rows of the result, so the workers never contend for the same memory, and is summed with
+a Tiled_Sum, so a worker's scratch memory stays fixed.
+The blocks are made larger (and remapped by the workers) only when the system outgrows
+them, and the pool is kept until close() or the model is garbage collected. """
+
+_blocks = {}                         # In each worker: {name of a block : SharedMemory}
+_tiled_sum = None                    # In each worker: the scratch for its tiles
+
+# Workers leave the terminal's process group, so Ctrl-C or a SIGTERM sent to the group
+# reaches only the main process, which then shuts the pool down. A worker killed while
+# holding the pool's queue lock would leave terminate() waiting on it forever.
+def _detach():
+    if hasattr(os, "setsid"): os.setsid()
+
+def _attach(name):
+    if name not in _blocks:
+        _blocks[name] = shared_memory.SharedMemory(name=name)
+    return _blocks[name].buf
+
+def _release(keep):
+    for name in [name for name in _blocks if name not in keep]:
+        _blocks.pop(name).close()
+
+# Runs in a worker: accelerations of rows[lo:hi] due to the first N masses, and their
+# potentials too if asked for
+def _tile(names, capacity, N, lo, hi, G, potential=False):
+    s_name, m_name, rows_name, acc_name, phi_name = names
+    _release(names)
+    s = np.ndarray((capacity,2), dtype=np.float64, buffer=_attach(s_name))[:N]
+    m = np.ndarray(capacity, dtype=np.float64, buffer=_attach(m_name))[:N]
+    rows = np.ndarray(capacity, dtype=np.int64, buffer=_attach(rows_name))
+    acc = np.ndarray((capacity,2), dtype=np.float64, buffer=_attach(acc_name))
+    phi = np.ndarray(capacity, dtype=np.float64, buffer=_attach(phi_name))
+    global _tiled_sum
+    if _tiled_sum is None: _tiled_sum = Tiled_Sum()
+    acc[lo:hi] = _tiled_sum.accelerations(s, m, G, rows=rows[lo:hi],
+                                          potential=phi[lo:hi] if potential else None)
+
+
+class Force_Pool:
+    max_pairs = 2**22                # Largest tile, in pairs, so the work is shared out evenly
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = multiprocessing.get_context("spawn").Pool(self.workers, initializer=_detach)
+        self.capacity, self.blocks = 0, []
+        self.finalizer = weakref.finalize(self, Force_Pool.shutdown, self.pool, self.blocks)
+
+    # Replaces the blocks with ones holding at least N masses
+    def allocate(self, N):
+        Force_Pool.unlink(self.blocks)
+        self.capacity = max(N, 2*self.capacity, 64)
+        sizes = (16*self.capacity, 8*self.capacity, 8*self.capacity, 16*self.capacity, 8*self.capacity)
+        self.blocks[:] = [shared_memory.SharedMemory(create=True, size=size) for size in sizes]
+        self.names = tuple(block.name for block in self.blocks)
+        s, m, rows, acc, phi = [block.buf for block in self.blocks]
+        self.s = np.ndarray((self.capacity,2), dtype=np.float64, buffer=s)
+        self.m = np.ndarray(self.capacity, dtype=np.float64, buffer=m)
+        self.rows = np.ndarray(self.capacity, dtype=np.int64, buffer=rows)
+        self.acc = np.ndarray((self.capacity,2), dtype=np.float64, buffer=acc)
+        self.phi = np.ndarray(self.capacity, dtype=np.float64, buffer=phi)
+
+    # Tiles of about equal size, at least one per worker and none above max_pairs
+    def tiles(self, R, N):
+        count = max(self.workers, -(-R*N//self.max_pairs))
+        edges = np.linspace(0, R, min(count, R) + 1).astype(np.int64)
+        return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+    # Given potential, as Tiled_Sum.accelerations, the rows' potentials are left in it
+    def accelerations(self, s, m, G, rows=None, potential=None):
+        N = len(s)
+        if rows is None: rows = np.arange(N)
+        R = len(rows)
+        if R == 0: return np.zeros((0,2))
+        if N > self.capacity: self.allocate(N)
+        self.s[:N], self.m[:N], self.rows[:R] = s, m, rows
+        self.pool.starmap(_tile, [(self.names, self.capacity, N, lo, hi, G, potential is not None)
+                                  for lo, hi in self.tiles(R, N)])
+        if potential is not None: potential[:] = self.phi[:R]
+        return self.acc[:R].copy()
+
+    def close(self):
+        self.finalizer()
+
+    @staticmethod
+    def unlink(blocks):
+        for block in blocks:
+            block.close()
+            block.unlink()
+        blocks.clear()
+
+    @staticmethod
+    def shutdown(pool, blocks):
+        pool.terminate()
+        pool.join()
+        Force_Pool.unlink(blocks)
+
+
+"""
+Parallel_Gravitation is Vectorised_Gravitation with the force pass done by a Force_Pool.
+It never builds the N x N arrays, so collisions use the grid search as in Barnes_Hut. """
+
+class Parallel_Gravitation(Vectorised_Gravitation):
+    pairwise = False
+    workers = None                   # Worker processes, None for one per core
+    def __init__(self, main, integrator=None, collisions=None):
+        self.force_pool = Force_Pool(Parallel_Gravitation.workers)
+        super().__init__(main, integrator, collisions)
+
+    def accelerations(self, s, rows=None):
+        return self.force_pool.accelerations(s, self.m, self.main.G, rows=rows,
+                                             potential=self.potential_out(s, rows))
+
+    def close(self):
+        self.force_pool.close()
@@ -0,0 +1,88 @@
+import numpy as np
+from Vectorised_Grav import *
+
+"""
+Particle-mesh approximation of the gravitational field for dense swarms of similar masses.
+Mass is spread over a square grid with cloud-in-cell weights, the field on the grid is found
+with FFTs and read back at each mass with the same weights, so the cost grows with the
+grid size rather than the number of pairs.
+The masses move in a plane but still pull with the inverse square law, so the grid is
+convolved with the free-space Green's function of the 3D Poisson equation (x/r^3, y/r^3)
+rather than solved as a periodic 2D Poisson equation, which would give 1/r forces.
+The grid is zero padded to twice its size so there are no periodic images. The potential,
+when asked for, is found the same way with -1/r, less each mass's own share of the grid.
+Anything closer than a cell or two is smoothed out, which suits clusters and discs but
+not a system dominated by one star. """
+
+class Particle_Mesh:
+    min_cell = 1.0                   # Smallest cell side (m), so h**2 can't underflow
+    def __init__(self, mesh=256):
+        assert mesh >= 4
+        self.mesh = mesh
+        # Field of a unit mass, in units of one cell, on the padded grid
+        n = 2*mesh
+        k = np.arange(n)
+        k = np.where(k < mesh, k, k - n).astype(np.float64)
+        x, y = np.meshgrid(k, k, indexing="ij")
+        r3 = (x**2 + y**2)**1.5
+        r3[0,0] = np.inf
+        self.kernel_x = np.fft.rfft2(-x/r3)
+        self.kernel_y = np.fft.rfft2(-y/r3)
+        self.kernel_phi = np.fft.rfft2(-1/r3**(1/3))
+
+    # Cloud-in-cell: the four grid points around each mass and their weights
+    def cic(self, u):
+        i = np.floor(u).astype(np.int64)
+        f = u - i
+        corners = [(0,0), (1,0), (0,1), (1,1)]
+        index = [(i[:,0] + a)*self.mesh + i[:,1] + b for a, b in corners]
+        weight = [(f[:,0] if a else 1 - f[:,0])*(f[:,1] if b else 1 - f[:,1]) for a, b in corners]
+        return index, weight
+
+    # Given potential, each mass's potential is left in it. A single mass, or masses all at
+    # the same point, have nothing the grid can resolve and are given no field at all.
+    def accelerations(self, s, m, G, potential=None):
+        mesh, n = self.mesh, 2*self.mesh
+        acc = np.zeros_like(s)
+        if potential is not None: potential[:] = 0
+        if len(m) < 2: return acc
+        lo = s.min(axis=0)
+        extent = (s.max(axis=0) - lo).max()
+        if extent == 0: return acc
+        h = max(extent/(mesh - 2), Particle_Mesh.min_cell)
+        index, weight = self.cic((s - lo)/h)
+        rho = sum(np.bincount(i, weights=m*w, minlength=mesh*mesh) for i, w in zip(index, weight))
+        rho_k = np.fft.rfft2(rho.reshape(mesh, mesh), s=(n, n))
+        gx = np.fft.irfft2(rho_k*self.kernel_x, s=(n, n))[:mesh,:mesh].ravel()
+        gy = np.fft.irfft2(rho_k*self.kernel_y, s=(n, n))[:mesh,:mesh].ravel()
+        for i, w in zip(index, weight):
+            acc[:,0] += w*gx[i]
+            acc[:,1] += w*gy[i]
+        if potential is not None:
+            phi = np.fft.irfft2(rho_k*self.kernel_phi, s=(n, n))[:mesh,:mesh].ravel()
+            potential[:] = sum(w*phi[i] for i, w in zip(index, weight))
+            # A mass's own cloud pulls on it through the grid points a cell or so apart
+            offset = lambda a, b: np.hypot(*(np.array(a) - np.array(b)))
+            corners = [(0,0), (1,0), (0,1), (1,1)]
+            for (a, wa) in zip(corners, weight):
+                for (b, wb) in zip(corners, weight):
+                    if a != b: potential += m*wa*wb/offset(a, b)
+            potential *= G/h
+        return acc*G/h**2
+
+
+"""
+Mesh_Gravitation swaps the pairwise force pass of Vectorised_Gravitation for the particle
+mesh. Everything else, including collisions and assymilate, is unchanged. """
+
+class Mesh_Gravitation(Vectorised_Gravitation):
+    pairwise = False
+    mesh = 256                       # Grid points along each side
+    def __init__(self, main, integrator=None, collisions=None):
+        self.particle_mesh = Particle_Mesh(Mesh_Gravitation.mesh)
+        super().__init__(main, integrator, collisions)
+
+    # The whole grid is solved whichever masses are asked for
+    def accelerations(self, s, rows=None):
+        acc = self.particle_mesh.accelerations(s, self.m, self.main.G, self.potential_out(s, rows))
+        return acc if rows is None else acc[rows]
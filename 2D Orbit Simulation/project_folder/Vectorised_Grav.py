@@ -0,0 +1,214 @@
+import numpy as np
+from Newtonian_Grav import *
+from array_functions import *
+from integrators import *
+from collision_events import *
+from registry import *
+
+"""
+Vectorised_Gravitation is a drop-in alternative to Gravitation for larger systems.
+Instead of building per-mass Python lists every frame, positions, velocities and masses
+are held in the contiguous float64 arrays of a Body_Registry and every pairwise interaction
+is computed in one broadcast pass. Main still drives it through the same nine phases and
+still sees a list of Mass instances in current_system, which are views of the registry. """
+
+class Vectorised_Gravitation(Gravitation):
+    pairwise = True                  # False for backends which never build N x N arrays
+    integrator = Euler()             # Or Leapfrog(), Yoshida4() etc. from integrators.py
+    collisions = None                # Collision_Queue() for continuous collision detection
+    def __init__(self, main, integrator=None, collisions=None):
+        if integrator is not None: self.integrator = integrator
+        if collisions is not None: self.collisions = collisions
+        self.max_time_step = self.integrator.max_time_step
+        super().__init__(main)
+
+    def initialise_data_structures(self):
+        super().initialise_data_structures()
+        self.registry = Body_Registry()
+        self.registry.add(self.current_system)
+        self.gR_current = False
+        self.r, self.r_mag, self.g = None, None, None
+        self.phi, self.phi_s = None, None    # Potential at each mass and where, see potential_out
+
+    # The per-mass state is the registry's, so integrators and backends can keep using
+    # model.s, model.v, model.gR etc. as plain arrays.
+    s = property(lambda self: self.registry.s, lambda self, s: setattr(self.registry, "s", s))
+    v = property(lambda self: self.registry.v, lambda self, v: setattr(self.registry, "v", v))
+    gR = property(lambda self: self.registry.gR, lambda self, g: setattr(self.registry, "gR", g))
+    m = property(lambda self: self.registry.m)
+    D = property(lambda self: self.registry.D)
+    density = property(lambda self: self.registry.density)
+
+    # Adds any masses spawned into current_system since the last step, and drops any
+    # taken out of it, leaving the rest of the registry as it was.
+    def load_arrays(self):
+        new = [n for n in self.current_system if n.registry is not self.registry]
+        self.registry.add(new)
+        if len(self.registry) != len(self.current_system):
+            current = np.array([n.ID for n in self.current_system], dtype=np.int64)
+            self.registry.remove(np.flatnonzero(~np.isin(self.registry.ID, current)))
+        self.gR_current = False
+
+    # 1. The network of every mass with every other mass is implicit in the arrays,
+    #    so all that is needed here is to pick up any change to current_system.
+    def mass_network(self):
+        if len(self.current_system) != len(self.registry) or \
+           any(n.registry is not self.registry for n in self.current_system):
+            self.load_arrays()
+
+    # 2.
+    def get_neighbours(self):
+        pass
+
+    # 3. r[i,j] points from mass i to mass j
+    def r_vectors(self):
+        if self.pairwise:
+            self.r = self.s[np.newaxis,:,:] - self.s[:,np.newaxis,:]
+
+    # 4.
+    def R_mag(self):
+        if self.pairwise:
+            self.r_mag = np.sqrt(self.r[...,0]**2 + self.r[...,1]**2)
+
+    # 5. Backends without the pairwise arrays produce the resultant field directly.
+    #    Nothing to do if the integrator has already left the field for these positions.
+    def g_vectors(self):
+        if self.gR_current: return
+        if not self.pairwise:
+            self.gR = self.accelerations(self.s)
+            return
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_r3 = 1/self.r_mag**3
+        np.fill_diagonal(inv_r3, 0)
+        self.g = self.main.G*self.r*(self.m[np.newaxis,:]*inv_r3)[...,np.newaxis]
+
+    # 6.
+    def resultant_g(self):
+        if self.pairwise and not self.gR_current:
+            self.gR = self.g.sum(axis=1)
+
+    # Field at positions s for the masses listed in rows (all of them by default),
+    # overridden by the approximate backends
+    def accelerations(self, s, rows=None):
+        return direct_accelerations(s, self.m, self.main.G, rows=rows)
+
+    # The array a force pass over every mass should leave each mass's potential in, when a
+    # Conservation_Monitor is about to measure, otherwise None. It is kept in phi along
+    # with the positions it was found at, so the monitor can tell whether it is current.
+    def potential_out(self, s, rows=None):
+        if self.monitor is None or not self.monitor.due: return None
+        if rows is not None and not np.array_equal(rows, np.arange(len(s))): return None
+        self.phi, self.phi_s = np.zeros(len(s)), s.copy()
+        return self.phi
+
+    # Relative error of accelerations() against the direct sum for up to sample masses.
+    # Returns the median, 99th percentile and maximum.
+    def force_error(self, sample=1000, seed=0):
+        N = len(self.s)
+        if N < 2: return {"median": 0, "p99": 0, "max": 0}
+        rows = np.random.default_rng(seed).choice(N, size=min(sample, N), replace=False)
+        approx = self.accelerations(self.s, rows=rows)
+        exact = np.concatenate([direct_accelerations(self.s, self.m, self.main.G, rows=chunk)
+                                for chunk in np.array_split(rows, max(1, len(rows)*N//2**22))])
+        error = np.hypot(*(approx - exact).T)/np.hypot(*exact.T)
+        return {"median": float(np.median(error)),
+                "p99": float(np.percentile(error, 99)),
+                "max": float(error.max())}
+
+    # 7.
+    def calc_velocity(self):
+        self.integrator.calc_velocity(self, self.dT)
+
+    # 8.
+    def reposition(self):
+        self.integrator.reposition(self, self.dT)
+
+    # How far each mass can reach this step, as in Gravitation.collision_candidates.
+    # LIMIT in remove_collided never exceeds the sum of the two masses' reach.
+    def collision_reach(self):
+        margin = np.hypot(*(np.abs(self.v) + np.abs(self.gR)*self.dT).T)*self.dT
+        return 0.5*self.D + 0.5 + margin
+
+    # Pairs (i, j) with i < j which could have collided, and the distance between them
+    def collision_candidates(self):
+        reach = self.collision_reach()
+        if not self.pairwise:
+            return near_pairs(self.s, reach)
+        i, j = np.nonzero(np.triu(self.r_mag <= reach[:,np.newaxis] + reach[np.newaxis,:], 1))
+        return i, j, self.r_mag[i, j]
+
+    # 9. Same closing-velocity test as Gravitation.remove_collided, evaluated for
+    #    every candidate pair at once. Returns the index arrays (i, j) of collided pairs.
+    def remove_collided(self):
+        if self.collisions is not None:
+            return self.collisions.collided(self)
+        i, j, distance = self.collision_candidates()
+        vf = np.abs(self.v[i]) + np.abs(self.v[j]) + (np.abs(self.gR[i]) + np.abs(self.gR[j]))*self.dT
+        vf_mag = np.hypot(vf[:,0], vf[:,1])
+        total_dist = self.D[i] + self.D[j]
+        del_threshold = (0.5*self.D[i] + 0.5*self.D[j])/total_dist
+        LIMIT = del_threshold + vf_mag*self.dT
+        hit = distance <= LIMIT
+        return i[hit], j[hit]
+
+    # 10. Groups the collided pairs into clusters as Gravitation.assymilate does and merges
+    #     every cluster at once with bincount, then rebuilds the arrays for the force pass.
+    def assymilate(self):
+        i, j = self.remove_collided()
+        if len(i) == 0: return
+        roots = helper_functions.clusters(zip(i.tolist(), j.tolist()))
+        idx = np.array(sorted(roots))
+        cluster = np.unique([roots[k] for k in idx], return_inverse=True)[1]
+        m = self.m[idx]
+        m_final = np.bincount(cluster, weights=m)
+        p = np.column_stack([np.bincount(cluster, weights=m*self.v[idx,k]) for k in range(2)])
+        ms = np.column_stack([np.bincount(cluster, weights=m*self.s[idx,k]) for k in range(2)])
+        density = np.bincount(cluster, weights=m*self.density[idx])
+        v_final, s_final = p/m_final[:,np.newaxis], ms/m_final[:,np.newaxis]
+        if self.monitor is not None:
+            dE, dL = merge_changes(self.s, self.v, self.m, idx, cluster, self.main.G)
+            self.merge_energy += dE
+            self.merge_angular_momentum += dL
+        avg_density = density/m_final
+        # Heaviest member of each cluster gives its colour
+        by_mass = np.lexsort((-m, cluster))
+        heaviest = idx[by_mass[np.flatnonzero(np.diff(np.append(-1, cluster[by_mass])))]]
+        IDs = self.registry.ID[idx].tolist()
+        colours = [tuple(self.registry.colour[k].tolist()) for k in heaviest]
+        merged = []
+        for c in range(len(m_final)):
+            self.substitute_colour = colours[c]
+            merged.append(Mass(m=float(m_final[c]), s=s_final[c].tolist(), v=v_final[c].tolist(),
+                               colour=self.substitute_colour, avg_density=float(avg_density[c])))
+        for ID, c in zip(IDs, cluster):
+            if ID == self.main.center_object_ID: merged[c].ID = self.main.center_object_ID
+        for ID, c in zip(IDs, cluster):
+            self.merged_into[ID] = merged[c].ID
+        gone, new = set(IDs), []
+        for n in self.current_system:
+            if n.ID in gone: n.detach()
+            else: new.append(n)
+        self.registry.remove(idx)
+        self.registry.add(merged)
+        new += merged
+        self.current_system = new
+        self.gR_current = False
+        self.r_vectors()
+        self.R_mag()
+
+
+"""
+Tiled_Gravitation never builds the N x N arrays. Its force pass is a Tiled_Sum, whose
+scratch memory is fixed by memory however many masses there are, and collisions use the
+grid search as in Barnes_Hut. """
+
+class Tiled_Gravitation(Vectorised_Gravitation):
+    pairwise = False
+    memory = 2**20                   # Bytes of scratch for the force pass, ~1MB fits in L2
+    def __init__(self, main, integrator=None, collisions=None):
+        self.tiled_sum = Tiled_Sum(Tiled_Gravitation.memory)
+        super().__init__(main, integrator, collisions)
+
+    def accelerations(self, s, rows=None):
+        return self.tiled_sum.accelerations(s, self.m, self.main.G, rows=rows,
+                                            potential=self.potential_out(s, rows))
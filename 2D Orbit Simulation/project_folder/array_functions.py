@@ -0,0 +1,142 @@
+import numpy as np
+
+"""
+Array routines shared by the NumPy backends and integrators. """
+
+# Acceleration of each mass listed in rows due to every other mass, summed directly
+def direct_accelerations(s, m, G, rows=None):
+    if rows is None: rows = np.arange(len(s))
+    r = s[np.newaxis,:,:] - s[rows,np.newaxis,:]
+    r_mag = np.sqrt(r[...,0]**2 + r[...,1]**2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_r3 = np.where(r_mag > 0, 1/r_mag**3, 0)
+    return G*(r*(m[np.newaxis,:]*inv_r3)[...,np.newaxis]).sum(axis=1)
+
+
+# Uniform grid neighbour search. Returns the pairs (i, j), i < j, of points in s lying
+# within reach[i] + reach[j] of each other and their separation, without testing every pair.
+def near_pairs(s, reach):
+    N = len(s)
+    empty = np.zeros(0, dtype=np.int64)
+    if N < 2: return empty, empty, np.zeros(0)
+    lo = s.min(axis=0)
+    cell = max(2*reach.max(), (s.max(axis=0) - lo).max()/2**20, 1e-300)
+    ix, iy = ((s - lo)//cell).astype(np.int64).T
+    key = ix*2**22 + iy
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+    I, J = [], []
+    for dx, dy in ((0,0), (1,-1), (1,0), (1,1), (0,1)):
+        target = (ix + dx)*2**22 + (iy + dy)
+        first = np.searchsorted(sorted_key, target, side="left")
+        last = np.searchsorted(sorted_key, target, side="right")
+        count = last - first
+        i = np.repeat(np.arange(N), count)
+        offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        j = order[np.repeat(first, count) + offset]
+        if (dx, dy) == (0,0):
+            keep = i < j
+            i, j = i[keep], j[keep]
+        I.append(i); J.append(j)
+    i, j = np.concatenate(I), np.concatenate(J)
+    distance = np.hypot(*(s[i] - s[j]).T)
+    keep = distance <= reach[i] + reach[j]
+    i, j = np.minimum(i[keep], j[keep]), np.maximum(i[keep], j[keep])
+    return i, j, distance[keep]
+
+
+# Potential energy, summed over i < j a block of rows at a time, so no more than about
+# max_pairs separations are held at once.
+def potential_energy(s, m, G, max_pairs=2**22):
+    N = len(m)
+    potential, block = 0.0, max(1, max_pairs//max(N, 1))
+    for lo in range(0, N, block):
+        hi = min(lo + block, N)
+        d = s[lo:hi,np.newaxis,:] - s[np.newaxis,lo:,:]
+        r = np.sqrt(d[...,0]**2 + d[...,1]**2)
+        upper = np.arange(lo, N)[np.newaxis,:] > np.arange(lo, hi)[:,np.newaxis]
+        potential -= G*(m[lo:hi,np.newaxis]*m[np.newaxis,lo:]/np.where(upper, r, np.inf)).sum()
+    return potential
+
+
+def total_energy(s, v, m, G, max_pairs=2**22):
+    return 0.5*(m*(v**2).sum(axis=1)).sum() + potential_energy(s, m, G, max_pairs)
+
+
+# Sum of -G*ma[i]*mb[j]/r over every i in a and j in b at a separation r > 0
+def cross_potential(sa, ma, sb, mb, G):
+    d = sa[:,np.newaxis,:] - sb[np.newaxis,:,:]
+    r = np.sqrt(d[...,0]**2 + d[...,1]**2)
+    with np.errstate(divide="ignore"):
+        inv_r = np.where(r > 0, 1/r, 0)
+    return -G*(ma[:,np.newaxis]*mb[np.newaxis,:]*inv_r).sum()
+
+
+# Change in total energy and in angular momentum when the masses in rows idx merge, one
+# new mass for each label in cluster, at their centre of mass and with their momentum.
+# Only the terms involving the merging masses change, so this is O(len(idx)*N).
+def merge_changes(s, v, m, idx, cluster, G):
+    M = np.bincount(cluster, weights=m[idx])
+    S = np.column_stack([np.bincount(cluster, weights=m[idx]*s[idx,k]) for k in range(2)])/M[:,np.newaxis]
+    V = np.column_stack([np.bincount(cluster, weights=m[idx]*v[idx,k]) for k in range(2)])/M[:,np.newaxis]
+    rest = np.ones(len(m), dtype=bool)
+    rest[idx] = False
+    def energy(s_, v_, m_):
+        return 0.5*(m_*(v_**2).sum(axis=1)).sum() + cross_potential(s_, m_, s[rest], m[rest], G) + \
+               0.5*cross_potential(s_, m_, s_, m_, G)
+    def angular_momentum(s_, v_, m_):
+        return (m_*(s_[:,0]*v_[:,1] - s_[:,1]*v_[:,0])).sum()
+    return energy(S, V, M) - energy(s[idx], v[idx], m[idx]), \
+           angular_momentum(S, V, M) - angular_momentum(s[idx], v[idx], m[idx])
+
+
+"""
+Tiled_Sum is the direct sum of direct_accelerations done a square tile of the interaction
+matrix at a time (rows of targets by columns of sources), every step written into the
+same preallocated scratch arrays with out=. The scratch is sized once from memory, a
+ceiling in bytes, so the extra memory doesn't grow with N and each tile stays in cache.
+Given an array potential (one entry per row), the potential -G*sum(m/r) at each target
+is left in it from the same separations. """
+
+class Tiled_Sum:
+    def __init__(self, memory=2**20):
+        # Four float64 arrays and one bool array per tile
+        self.tile = max(16, int((memory/33)**0.5))
+        t = self.tile
+        self.dx, self.dy, self.r2, self.w = [np.empty((t,t)) for _ in range(4)]
+        self.same = np.empty((t,t), dtype=bool)
+
+    def accelerations(self, s, m, G, rows=None, potential=None):
+        x, y = np.ascontiguousarray(s[:,0]), np.ascontiguousarray(s[:,1])
+        if rows is None: rows = np.arange(len(s))
+        acc = np.zeros((len(rows),2))
+        if potential is not None: potential[:] = 0
+        t, N = self.tile, len(s)
+        for i0 in range(0, len(rows), t):
+            I = rows[i0:i0+t]
+            xi, yi = x[I,np.newaxis], y[I,np.newaxis]
+            for j0 in range(0, N, t):
+                j1 = min(j0 + t, N)
+                shape = (len(I), j1 - j0)
+                dx, dy, r2, w = [a[:shape[0],:shape[1]] for a in (self.dx, self.dy, self.r2, self.w)]
+                same = self.same[:shape[0],:shape[1]]
+                np.subtract(x[j0:j1], xi, out=dx)
+                np.subtract(y[j0:j1], yi, out=dy)
+                np.multiply(dx, dx, out=r2)
+                np.multiply(dy, dy, out=w)
+                r2 += w
+                np.equal(r2, 0, out=same)
+                r2[same] = 1
+                np.sqrt(r2, out=w)
+                if potential is not None:
+                    phi = m[j0:j1]/w
+                    phi[same] = 0
+                    potential[i0:i0+len(I)] -= G*phi.sum(axis=1)
+                w *= r2
+                np.divide(m[j0:j1], w, out=w)
+                w[same] = 0
+                dx *= w
+                dy *= w
+                acc[i0:i0+len(I),0] += dx.sum(axis=1)
+                acc[i0:i0+len(I),1] += dy.sum(axis=1)
+        return G*acc
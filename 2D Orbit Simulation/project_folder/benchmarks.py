@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from headless import *
+from Batched_Grav import *
+
+"""
+Benchmarks for the Gravitation backends. Nothing here opens a window: the models are
+driven by Headless_Main, the stand-in for Main used by headless.py.
+Run this file directly to print the results. With --report the standard suite is run
+instead and written as one JSON document, so runs on different commits can be compared
+on the same axes: steps/sec and peak memory against N for each backend, the same for the
+standard scenarios along with their merges and energy drift, and the energy error of the
+solar system against time_step. Every system in the suite comes from a fixed seed.
+
+    python benchmarks.py --report report.json [--quick]
+"""
+
+
+def steps_per_second(model, N, min_time=1.0, max_steps=200):
+    Model_System = model(Headless_Main(input=random_cluster(N)))
+    step(Model_System)
+    return timed_steps(Model_System, min_time, max_steps)
+
+
+# Steps/sec of a model already built, stepping it for about min_time seconds
+def timed_steps(Model_System, min_time=1.0, max_steps=200):
+    steps, start = 0, time.perf_counter()
+    while time.perf_counter() - start < min_time and steps < max_steps:
+        step(Model_System)
+        Model_System.main.time_elapsed += Model_System.dT
+        steps += 1
+    return steps/(time.perf_counter() - start)
+
+
+# Largest amount of memory (MB) allocated at once during one step. Kept apart from the
+# timing, as tracemalloc slows down the allocations it watches.
+def peak_memory(Model_System):
+    tracemalloc.start()
+    step(Model_System)
+    Model_System.main.time_elapsed += Model_System.dT
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak/2**20
+
+
+# Steps/sec of both backends. The list backend is only run while it stays under a few
+# seconds per step, past that it is reported as None.
+def vectorised_scaling(sizes=(10, 30, 100, 300, 1000, 3000, 5000), list_limit=300):
+    results = []
+    for N in sizes:
+        lists = steps_per_second(Gravitation, N) if N <= list_limit else None
+        arrays = steps_per_second(Vectorised_Gravitation, N)
+        results.append({"N": N, "Gravitation": lists, "Vectorised_Gravitation": arrays})
+    return results
+
+
+# Runs both backends side by side and returns the largest position difference seen,
+# relative to the larger of AU and the body's distance from the origin.
+def trajectory_check(N=50, steps=500, seed=1):
+    lists = Gravitation(Headless_Main(input=random_cluster(N, seed)))
+    arrays = Vectorised_Gravitation(Headless_Main(input=random_cluster(N, seed)))
+    worst = 0
+    for _ in range(steps):
+        step(lists)
+        step(arrays)
+        if len(lists.current_system) != len(arrays.current_system): break
+        for a, b in zip(lists.current_system, arrays.current_system):
+            scale = max(math.hypot(*a.s), AU)
+            worst = max(worst, math.hypot(a.s[0]-b.s[0], a.s[1]-b.s[1])/scale)
+    return worst
+
+
+# Steps the particle mesh through the cases its grid can't resolve: a single mass, masses
+# all at the same point, and one mass spawned into an empty sky as Main does. Returns
+# whether every position stayed finite in each case.
+def mesh_degenerate_check(steps=5):
+    results = {}
+    for name, system in (("one mass", random_cluster(1)),
+                         ("coincident", [Mass(m=10**24, s=[AU,0], v=[0,0]) for _ in range(3)]),
+                         ("spawned", [])):
+        Model_System = Mesh_Gravitation(Headless_Main(input=system))
+        if name == "spawned": Model_System.current_system.append(Mass(m=10**24, s=[AU,0], v=[0,0]))
+        for _ in range(steps):
+            step(Model_System)
+            Model_System.main.time_elapsed += Model_System.dT
+        results[name] = bool(np.isfinite(Model_System.s).all())
+    return results
+
+
+# Tree error against the direct sum and speed for each opening angle, used to pick theta
+def barnes_hut_errors(N=2000, thetas=(0.2, 0.3, 0.5, 0.7, 1.0)):
+    default, results = Barnes_Hut_Gravitation.theta, []
+    for theta in thetas:
+        Barnes_Hut_Gravitation.theta = theta
+        Model_System = Barnes_Hut_Gravitation(Headless_Main(input=random_cluster(N)))
+        step(Model_System)
+        row = {"theta": theta, **Model_System.force_error()}
+        row["steps/sec"] = steps_per_second(Barnes_Hut_Gravitation, N)
+        results.append(row)
+    Barnes_Hut_Gravitation.theta = default
+    return results
+
+
+# Steps/sec of the backends which avoid the N x N arrays
+def large_n_scaling(sizes=(1000, 5000, 20000, 50000), max_steps=5,
+                    models=(Barnes_Hut_Gravitation, Mesh_Gravitation)):
+    return [{"N": N, **{model.__name__: steps_per_second(model, N, max_steps=max_steps)
+                        for model in models}} for N in sizes]
+
+
+# Largest relative energy error over the same simulated time for each integrator and
+# time step, along with the wall clock time the run took. Collisions are found with
+# Collision_Queue, as the per-step test merges planets at the larger steps, and the
+# bodies left are given so any merge that still happens can be seen.
+def integrator_energy_error(N=10, years=10, time_steps=(10**4, 10**5, 10**6, 10**7),
+                            integrators=(Euler, Leapfrog, Velocity_Verlet, Yoshida4, Wisdom_Holman,
+                                         Block_Leapfrog)):
+    default, results = Vectorised_Gravitation.time_step, []
+    for integrator in integrators:
+        for time_step in time_steps:
+            if time_step > integrator.max_time_step: continue
+            Vectorised_Gravitation.time_step = time_step
+            Model_System = Vectorised_Gravitation(Headless_Main(input=random_cluster(N)),
+                                                  integrator=integrator(), collisions=Collision_Queue())
+            step(Model_System)
+            E0, worst = energy(Model_System), 0
+            start = time.perf_counter()
+            for _ in range(int(years*365*24*3600/time_step)):
+                step(Model_System)
+                worst = max(worst, abs(energy(Model_System)/E0 - 1))
+            results.append({"integrator": integrator.__name__, "time_step": time_step,
+                            "energy_error": worst, "seconds": time.perf_counter() - start,
+                            "bodies": len(Model_System.current_system),
+                            "merges": len(Model_System.merged_into)})
+    Vectorised_Gravitation.time_step = default
+    return results
+
+
+# Peak memory allocated during one step and steps/sec, for the N x N arrays of
+# Vectorised_Gravitation (while they fit under pairwise_limit) and for Tiled_Gravitation
+def tiled_memory(sizes=(1000, 5000, 20000), pairwise_limit=5000):
+    results = []
+    for N in sizes:
+        row = {"N": N}
+        models = (Vectorised_Gravitation, Tiled_Gravitation) if N <= pairwise_limit else (Tiled_Gravitation,)
+        for model in models:
+            Model_System = model(Headless_Main(input=random_cluster(N)))
+            step(Model_System)
+            tracemalloc.start()
+            start = time.perf_counter()
+            step(Model_System)
+            seconds = time.perf_counter() - start
+            row[model.__name__] = {"peak_MB": tracemalloc.get_traced_memory()[1]/2**20,
+                                   "steps/sec": 1/seconds}
+            tracemalloc.stop()
+        results.append(row)
+    return results
+
+
+# Steps/sec of Parallel_Gravitation with each number of workers. The pool is started
+# before the clock is, as it lasts for the whole run.
+def parallel_scaling(sizes=(2000, 5000, 10000), workers=None, max_steps=10):
+    workers = workers or sorted({1, 2, 4, os.cpu_count() or 1})
+    default, results = Parallel_Gravitation.workers, []
+    for N in sizes:
+        row = {"N": N}
+        for w in workers:
+            Parallel_Gravitation.workers = w
+            Model_System = Parallel_Gravitation(Headless_Main(input=random_cluster(N)))
+            step(Model_System)
+            start = time.perf_counter()
+            for _ in range(max_steps): step(Model_System)
+            row[w] = max_steps/(time.perf_counter() - start)
+            Model_System.close()
+        results.append(row)
+    Parallel_Gravitation.workers = default
+    return results
+
+
+# System-steps/sec for B perturbed solar systems stepped one after another and as a batch
+def batched_speedup(batches=(1, 10, 100, 1000), steps=50, time_step=10**5):
+    results = []
+    for B in batches:
+        systems = [perturbed_solar_system(seed) for seed in range(B)]
+        serial = [build(system, Vectorised_Gravitation, Leapfrog(), time_step=time_step)
+                  for system in systems[:10]]
+        start = time.perf_counter()
+        for Model_System in serial:
+            for _ in range(steps): step(Model_System)
+        one_by_one = len(serial)*steps/(time.perf_counter() - start)
+        Model_System = build(systems, Batched_Gravitation, Leapfrog(), time_step=time_step)
+        start = time.perf_counter()
+        for _ in range(steps): step(Model_System)
+        batched = B*steps/(time.perf_counter() - start)
+        results.append({"B": B, "one_by_one": one_by_one, "batched": batched})
+    return results
+
+
+# The backends in the suite and the largest N each is run at
+SUITE_MODELS = ((Gravitation, 300), (Vectorised_Gravitation, 1000), (Tiled_Gravitation, 10**4),
+                (Barnes_Hut_Gravitation, 10**5), (Mesh_Gravitation, 10**5))
+
+
+# Steps/sec and peak memory of each backend on random clusters of each size
+def scaling_suite(sizes=(10, 100, 1000, 10**4, 10**5), models=SUITE_MODELS, min_time=1.0):
+    results = []
+    for N in sizes:
+        for model, limit in models:
+            if N > limit: continue
+            Model_System = model(Headless_Main(input=random_cluster(N)))
+            step(Model_System)
+            results.append({"N": N, "model": model.__name__,
+                            "peak_MB": peak_memory(Model_System),
+                            "steps/sec": timed_steps(Model_System, min_time)})
+    return results
+
+
+# Each scenario run for a number of steps by the list and array backends: steps/sec, peak
+# memory, masses left, merges and the energy drift at the end (with what the merges took
+# taken out, see diagnostics.py). The last step is always measured, exactly if its force
+# pass left no potential, so the drift is never from an earlier step.
+def scenario_suite(steps=500, scenarios=(("solar_system", solar_system), ("collapse", collapse)),
+                   models=(Gravitation, Vectorised_Gravitation)):
+    results = []
+    for name, scenario in scenarios:
+        for model in models:
+            Model_System = build(scenario(), model)
+            Model_System.monitor = Conservation_Monitor(every=steps)
+            peak = peak_memory(Model_System)
+            rate = timed_steps(Model_System, min_time=math.inf, max_steps=steps - 2)
+            Model_System.monitor.due, Model_System.monitor.exact = True, True
+            step(Model_System)
+            conservation = Model_System.monitor.latest
+            results.append({"scenario": name, "model": model.__name__, "steps": steps,
+                            "steps/sec": rate, "peak_MB": peak,
+                            "bodies": len(Model_System.current_system),
+                            "merges": len(Model_System.merged_into),
+                            "energy_drift": conservation["energy_drift"],
+                            "momentum_drift": conservation["momentum_drift"],
+                            "angular_momentum_drift": conservation["angular_momentum_drift"]})
+    return results
+
+
+# Largest relative energy error of the solar system over the same simulated time for
+# each time_step, with the list backend and with the array backend's integrators. The
+# array backend finds collisions with Collision_Queue, as the per-step test merges the
+# inner planets at the larger steps. Each row gives the bodies left and the merges, and
+# the error of a row with merges is mostly what they took, not the step's.
+def accuracy_suite(years=1, time_steps=(500, 1000, 2000, 5000, 10**4, 10**5, 10**6),
+                   models=((Gravitation, None), (Vectorised_Gravitation, Leapfrog),
+                           (Vectorised_Gravitation, Yoshida4))):
+    results = []
+    for model, integrator in models:
+        for time_step in time_steps:
+            limit = integrator.max_time_step if integrator else model.max_time_step
+            if time_step > limit: continue
+            Model_System = build(solar_system(), model, integrator() if integrator else None,
+                                 Collision_Queue() if integrator else None, time_step=time_step)
+            E0, worst = energy(Model_System), 0
+            start = time.perf_counter()
+            for _ in range(math.ceil(years*YEAR/time_step)):
+                step(Model_System)
+                worst = max(worst, abs(energy(Model_System)/E0 - 1))
+            results.append({"model": model.__name__,
+                            "integrator": integrator.__name__ if integrator else None,
+                            "time_step": time_step, "energy_error": worst,
+                            "seconds": time.perf_counter() - start,
+                            "bodies": len(Model_System.current_system),
+                            "merges": len(Model_System.merged_into)})
+    return results
+
+
+# What the suite was run on, so reports from different machines aren't mistaken for each other
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "processor": platform.processor(),
+            "cpu_count": os.cpu_count()}
+
+
+# The whole suite as one dict. quick cuts it down to a minute or so, for checking that a
+# change hasn't broken anything rather than for measuring it.
+def report(quick=False):
+    if quick:
+        return {"environment": environment(),
+                "scaling": scaling_suite(sizes=(10, 100, 1000), min_time=0.2),
+                "scenarios": scenario_suite(steps=100),
+                "accuracy": accuracy_suite(years=0.1, time_steps=(1000, 10**4, 10**5))}
+    return {"environment": environment(), "scaling": scaling_suite(),
+            "scenarios": scenario_suite(), "accuracy": accuracy_suite()}
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Gravitation backends.")
+    parser.add_argument("--report", default=None, metavar="PATH",
+                        help="run the standard suite and write it to PATH as JSON, - for stdout")
+    parser.add_argument("--quick", action="store_true", help="a smaller suite, to check it runs")
+    return parser.parse_args(argv)
+
+
+def print_tables():
+    print(f"Max relative trajectory difference: {trajectory_check():.3e}")
+    print(f"{'N':>6} {'Gravitation':>14} {'Vectorised':>14}   (steps/sec)")
+    for row in vectorised_scaling():
+        lists = "-" if row["Gravitation"] is None else f"{row['Gravitation']:.1f}"
+        print(f"{row['N']:>6} {lists:>14} {row['Vectorised_Gravitation']:>14.1f}")
+    print("Particle mesh stays finite: " +
+          ", ".join(f"{name} {ok}" for name, ok in mesh_degenerate_check().items()))
+    print(f"{'theta':>6} {'median':>10} {'p99':>10} {'max':>10} {'steps/sec':>10}")
+    for row in barnes_hut_errors():
+        print(f"{row['theta']:>6} {row['median']:>10.2e} {row['p99']:>10.2e} "
+              f"{row['max']:>10.2e} {row['steps/sec']:>10.1f}")
+    print(f"{'N':>6} {'Barnes-Hut':>14} {'Mesh':>14}   (steps/sec)")
+    for row in large_n_scaling():
+        print(f"{row['N']:>6} {row['Barnes_Hut_Gravitation']:>14.2f} {row['Mesh_Gravitation']:>14.2f}")
+    print(f"{'integrator':>16} {'time_step':>10} {'energy error':>13} {'seconds':>8} {'merges':>7}")
+    for row in integrator_energy_error():
+        print(f"{row['integrator']:>16} {row['time_step']:>10} {row['energy_error']:>13.2e} "
+              f"{row['seconds']:>8.2f} {row['merges']:>7}")
+    print(f"{'B':>6} {'one by one':>14} {'batched':>14}   (system steps/sec)")
+    for row in batched_speedup():
+        print(f"{row['B']:>6} {row['one_by_one']:>14.0f} {row['batched']:>14.0f}")
+    print(f"{'N':>6} {'pairwise MB':>12} {'steps/sec':>10} {'tiled MB':>10} {'steps/sec':>10}")
+    for row in tiled_memory():
+        pairwise = row.get("Vectorised_Gravitation", {"peak_MB": math.nan, "steps/sec": math.nan})
+        tiled = row["Tiled_Gravitation"]
+        print(f"{row['N']:>6} {pairwise['peak_MB']:>12.1f} {pairwise['steps/sec']:>10.2f} "
+              f"{tiled['peak_MB']:>10.1f} {tiled['steps/sec']:>10.2f}")
+    scaling = parallel_scaling()
+    print(f"{'N':>6} " + " ".join(f"{str(w) + ' cores':>10}" for w in scaling[0] if w != "N"))
+    for row in scaling:
+        print(f"{row['N']:>6} " + " ".join(f"{row[w]:>10.2f}" for w in row if w != "N"))
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.report is None:
+        print_tables()
+    else:
+        results = json.dumps(report(args.quick), indent=1)
+        if args.report == "-": print(results)
+        else:
+            with open(args.report, "w") as file: file.write(results + "\n")
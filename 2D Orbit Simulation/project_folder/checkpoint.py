@@ -0,0 +1,155 @@
+import os
+import json
+import heapq
+import time
+import numpy as np
+from Vectorised_Grav import *
+from Barnes_Hut import *
+from Particle_Mesh import *
+from Parallel_Grav import *
+
+"""
+Checkpoints of a running model, so a long run can be resumed after the window is closed,
+or several experiments forked from the same mid-run state. A checkpoint holds everything
+needed to carry on exactly where the run stopped: every mass (ID, mass, position,
+velocity, density, colour) in the backend's own order, the Mass.id counter, time_elapsed,
+center_object_ID, time_step and dT, the field last computed (which the list backend's
+collision test reads before the next force pass), merged_into, and the state of the
+integrator and the Collision_Queue.
+The file is an uncompressed .npz: one raw array per field and a JSON header, so it is
+written and read in milliseconds even for 100k masses. save writes to a temporary file
+and renames it, so a checkpoint is never left half written. """
+
+VERSION = 1
+
+
+# The class called name, searched for among base and its subclasses
+def named(base, name):
+    classes = [base]
+    while classes:
+        cls = classes.pop()
+        if cls.__name__ == name: return cls
+        classes += cls.__subclasses__()
+    raise KeyError(name)
+
+
+def save(path, Model_System):
+    main = Model_System.main
+    assert not isinstance(Model_System.merged_into, list), "batched models can't be saved"
+    header = {"version": VERSION, "model": type(Model_System).__name__,
+              "next_ID": Mass.id, "time_elapsed": main.time_elapsed,
+              "center_object_ID": main.center_object_ID,
+              "time_step": Model_System.time_step, "dT": Model_System.dT,
+              "integrator": None, "integrator_state": {}, "collisions": None}
+    arrays = {}
+    registry = getattr(Model_System, "registry", None)
+    if registry is not None:
+        arrays.update(ID=registry.ID, m=registry.m, s=registry.s, v=registry.v,
+                      density=registry.density, colour=registry.colour, gR=registry.gR)
+        header["gR_current"] = bool(Model_System.gR_current)
+        integrator = Model_System.integrator
+        header["integrator"] = type(integrator).__name__
+        for key, value in vars(integrator).items():
+            if isinstance(value, np.ndarray): arrays["integrator." + key] = value
+            else: header["integrator_state"][key] = value
+        if Model_System.collisions is not None:
+            header["collisions"] = type(Model_System.collisions).__name__
+            header["queue"] = queue_state(Model_System.collisions, registry, arrays)
+    else:
+        system = Model_System.current_system
+        arrays.update(ID=np.array([n.ID for n in system], dtype=np.int64).reshape(-1),
+                      m=np.array([n.m for n in system], dtype=np.float64).reshape(-1),
+                      s=np.array([n.s for n in system], dtype=np.float64).reshape(-1,2),
+                      v=np.array([n.v for n in system], dtype=np.float64).reshape(-1,2),
+                      density=np.array([n.avg_density for n in system], dtype=np.float64).reshape(-1),
+                      colour=np.array([n.colour for n in system], dtype=np.uint8).reshape(-1,3),
+                      # NaN for masses added since the last step, which have no field yet
+                      gR=np.array([n.gR if len(n.gR) == 2 else (np.nan, np.nan) for n in system],
+                                  dtype=np.float64).reshape(-1,2))
+        header["gR_current"] = False
+    arrays["merged_from"] = np.array(list(Model_System.merged_into), dtype=np.int64)
+    arrays["merged_into"] = np.array(list(Model_System.merged_into.values()), dtype=np.int64)
+    arrays["header"] = np.frombuffer(json.dumps(header).encode(), dtype=np.uint8)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(temporary, path)
+
+
+# A Collision_Queue's events name masses by registry serial, which isn't kept across a
+# restore, so they are saved by row and renumbered when loaded.
+def queue_state(queue, registry, arrays):
+    row = dict(zip(registry.serial.tolist(), range(len(registry))))
+    events = [(t, count, row[a], row[b]) for t, count, a, b in queue.heap if a in row and b in row]
+    arrays["queue.time"] = np.array([e[0] for e in events], dtype=np.float64)
+    arrays["queue.count"] = np.array([e[1] for e in events], dtype=np.int64)
+    arrays["queue.rows"] = np.array([e[2:] for e in events], dtype=np.int64).reshape(-1,2)
+    arrays["queue.known"] = np.array(sorted(row[n] for n in queue.known if n in row), dtype=np.int64)
+    return {"now": queue.now, "rescan_time": queue.rescan_time, "count": queue.count}
+
+
+# Rebuilds the model saved at path around main (a Main or Headless_Main), replacing its
+# input, time_elapsed and center_object_ID. model, if given, replaces the saved backend,
+# for instance to carry on a run with Barnes_Hut_Gravitation.
+def load(path, main, model=None):
+    with np.load(path) as file:
+        arrays = {key: file[key] for key in file.files}
+    header = json.loads(arrays.pop("header").tobytes().decode())
+    assert header["version"] == VERSION
+    system = []
+    for ID, m, s, v, density, colour in zip(arrays["ID"].tolist(), arrays["m"].tolist(),
+                                             arrays["s"].tolist(), arrays["v"].tolist(),
+                                             arrays["density"].tolist(), arrays["colour"].tolist()):
+        n = Mass(m=m, s=s, v=v, colour=tuple(colour), avg_density=density)
+        n.ID = ID
+        system.append(n)
+    Mass.id = header["next_ID"]
+    main.input, main.center_object_ID = system, header["center_object_ID"]
+    main.time_elapsed = header["time_elapsed"]
+    model = model or named(Gravitation, header["model"])
+    if issubclass(model, Vectorised_Gravitation):
+        integrator = named(Euler, header["integrator"])() if header["integrator"] else None
+        collisions = named(Collision_Queue, header["collisions"])() if header["collisions"] else None
+        Model_System = model(main, integrator, collisions)
+    else:
+        Model_System = model(main)
+    Model_System.time_step, Model_System.dT = header["time_step"], header["dT"]
+    Model_System.merged_into = dict(zip(arrays["merged_from"].tolist(), arrays["merged_into"].tolist()))
+    if not isinstance(Model_System, Vectorised_Gravitation) and "gR" in arrays:
+        for n, gR in zip(system, arrays["gR"].tolist()):
+            if not np.isnan(gR[0]): n.gR = gR
+    elif isinstance(Model_System, Vectorised_Gravitation) and "gR" in arrays:
+        # The registry numbers its rows' serials from 0, in the order they were saved
+        Model_System.registry.gR[:] = np.nan_to_num(arrays["gR"])
+        Model_System.gR_current = header["gR_current"]
+        if header["integrator"] == type(Model_System.integrator).__name__:
+            for key, value in header["integrator_state"].items():
+                setattr(Model_System.integrator, key, value)
+            for key in arrays:
+                if key.startswith("integrator."):
+                    setattr(Model_System.integrator, key[len("integrator."):], arrays[key])
+        if Model_System.collisions is not None and "queue" in header:
+            queue = Model_System.collisions
+            queue.now, queue.rescan_time = header["queue"]["now"], header["queue"]["rescan_time"]
+            queue.count = header["queue"]["count"]
+            queue.heap = list(zip(arrays["queue.time"].tolist(), arrays["queue.count"].tolist(),
+                                  arrays["queue.rows"][:,0].tolist(), arrays["queue.rows"][:,1].tolist()))
+            heapq.heapify(queue.heap)
+            queue.known = set(arrays["queue.known"].tolist())
+    return Model_System
+
+
+# Saves a checkpoint whenever more than every seconds of wall time have passed since the
+# last one. Call tick once per step.
+class Auto_Checkpoint:
+    def __init__(self, path, every=300):
+        self.path, self.every = path, every
+        self.last = time.perf_counter()
+
+    def tick(self, Model_System):
+        if time.perf_counter() - self.last >= self.every:
+            self.save(Model_System)
+
+    def save(self, Model_System):
+        save(self.path, Model_System)
+        self.last = time.perf_counter()
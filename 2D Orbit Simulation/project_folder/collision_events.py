@@ -0,0 +1,96 @@
+import heapq
+import numpy as np
+from array_functions import *
+
+"""
+Continuous collision detection for the array backends, used in place of the LIMIT test
+in remove_collided. Two masses touch when they are closer than the sum of their radii.
+Assuming each moves in a straight line during a step, the moment of contact is a root of
+a quadratic, so masses which would pass through one another inside a step are still caught.
+
+Predicted contacts sit in a heap ordered by time. Pairs are only searched for every
+horizon steps, or for masses which have just appeared (spawned or the result of a merge).
+Events name masses by their registry serial, so predictions for merged masses are simply
+dropped when they come off the heap and nothing else is recomputed. Gravity bends the
+straight lines, so predictions are made with the contact distance widened by how far the
+pair's accelerations could pull them together, which can only make a contact look earlier. Each event is checked again against the
+current positions and velocities when it falls due. """
+
+# Earliest t >= 0 at which |d + u*t| <= R, or inf if that never happens
+def contact_times(d, u, R):
+    dd = (d**2).sum(axis=1)
+    du = (d*u).sum(axis=1)
+    uu = (u**2).sum(axis=1)
+    disc = du**2 - uu*(dd - R**2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (-du - np.sqrt(np.maximum(disc, 0)))/uu
+    t = np.where((du < 0) & (disc >= 0) & (uu > 0), t, np.inf)
+    return np.where(dd <= R**2, 0, t)
+
+
+class Collision_Queue:
+    horizon = 8                      # Steps between full searches for approaching pairs
+    def __init__(self):
+        self.heap, self.known = [], set()
+        self.now, self.rescan_time, self.count = 0, 0, 0
+
+    # Earliest time masses i and j could touch, allowing for their accelerations over window
+    def predict(self, model, i, j, window):
+        d, u = model.s[j] - model.s[i], model.v[j] - model.v[i]
+        A = np.hypot(*model.gR[i].T) + np.hypot(*model.gR[j].T)
+        R = 0.5*(model.D[i] + model.D[j]) + 0.5*A*window**2
+        return contact_times(d, u, R)
+
+    def push(self, model, i, j, t):
+        keep = t <= self.rescan_time - self.now
+        serial = model.registry.serial.tolist()
+        for a, b, when in zip(i[keep], j[keep], t[keep]):
+            self.count += 1
+            heapq.heappush(self.heap, (self.now + when, self.count, serial[a], serial[b]))
+
+    # Every pair which could come into contact before the next full search
+    def rescan(self, model):
+        window = self.horizon*model.dT
+        self.heap, self.rescan_time = [], self.now + window
+        reach = 0.5*model.D + np.hypot(*model.v.T)*window + 0.5*np.hypot(*model.gR.T)*window**2
+        i, j, _ = near_pairs(model.s, reach)
+        self.push(model, i, j, self.predict(model, i, j, window))
+        self.known = set(model.registry.serial.tolist())
+
+    # Pairs between masses which have appeared since the last step and everything else
+    def add_new(self, model):
+        serial = model.registry.serial.tolist()
+        new = [ind for ind, n in enumerate(serial) if n not in self.known]
+        if len(new) == 0: return
+        window = self.rescan_time - self.now
+        N = len(serial)
+        i = np.repeat(np.array(new), N)
+        j = np.tile(np.arange(N), len(new))
+        keep = i != j
+        i, j = i[keep], j[keep]
+        self.push(model, i, j, self.predict(model, i, j, window))
+        self.known = set(serial)
+
+    # Index arrays (i, j) of the pairs touching during the coming step
+    def collided(self, model):
+        hits = []
+        if self.now >= self.rescan_time: self.rescan(model)
+        else: self.add_new(model)
+        index = {n: ind for ind, n in enumerate(model.registry.serial.tolist())}
+        end, retry = self.now + model.dT, []
+        while self.heap and self.heap[0][0] <= end:
+            _, _, a, b = heapq.heappop(self.heap)
+            if a not in index or b not in index: continue
+            i, j = np.array([index[a]]), np.array([index[b]])
+            d, u = model.s[j] - model.s[i], model.v[j] - model.v[i]
+            if contact_times(d, u, 0.5*(model.D[i] + model.D[j]))[0] <= model.dT:
+                hits.append((i[0], j[0]))
+            else:
+                retry.append((i, j))
+        window = self.rescan_time - self.now
+        self.now = end
+        for i, j in retry:
+            # Not touching this step, so the earliest they can is the start of the next one
+            self.push(model, i, j, np.maximum(self.predict(model, i, j, window) - model.dT, 0))
+        hits = np.array(hits, dtype=np.int64).reshape(-1,2)
+        return hits[:,0], hits[:,1]
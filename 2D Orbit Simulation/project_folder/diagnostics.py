@@ -0,0 +1,83 @@
+import numpy as np
+from Vectorised_Grav import *
+
+"""
+Conservation_Monitor tracks the total kinetic and potential energy, linear momentum and
+angular momentum of a model and how far each has drifted since monitoring began, which
+is how to tell whether a large time_step or a coarse approximation can still be trusted.
+Attach one as Model_System.monitor. The phases then call observe every step, between
+resultant_g and calc_velocity, when positions, velocities and the force pass all belong
+to the same moment, and it measures on the first step and every `every` steps after.
+The potential is never summed again over every pair: the pairwise array backends' comes
+from r_mag, and on the steps before a measurement (while due is set) the list backend's
+g_vectors and the other backends' own force passes (tiles, tree walk, mesh) also leave
+each mass's potential, the approximate backends' as approximate as their forces. When
+the step's force pass gave none (after a merge in the list backend, or when the
+integrator skips the full force pass, as Wisdom_Holman does) the measurement waits for
+a step which does, unless exact is set, when a blocked O(N^2) sum is done instead.
+Merges lose energy and angular momentum (to heat and spin, which aren't modelled). While
+a monitor is attached assymilate adds up these changes in merge_energy and
+merge_angular_momentum, and the drifts are measured after taking them out. Momentum
+drift is relative to the sum of m|v| at the start, as the total is often close to 0. """
+
+class Conservation_Monitor:
+    def __init__(self, every=10, exact=False):
+        self.every, self.exact, self.steps = every, exact, 0
+        self.due = True                  # The force pass of the coming step should give potentials
+        self.initial, self.latest = None, None
+
+    def observe(self, Model_System):
+        self.steps += 1
+        if self.due:
+            latest = self.measure(Model_System)
+            if latest is not None: self.latest, self.due = latest, False
+        if (self.steps + 1) % self.every == 0: self.due = True
+
+    # Total potential energy, or None if the force pass didn't leave it
+    def potential(self, Model_System, s, m):
+        G = Model_System.main.G
+        if isinstance(Model_System, Vectorised_Gravitation):
+            r_mag, phi = Model_System.r_mag, Model_System.phi
+            if Model_System.pairwise and r_mag is not None and r_mag.shape == (len(m), len(m)):
+                with np.errstate(divide="ignore"):
+                    inv_r = np.where(r_mag > 0, 1/r_mag, 0)
+                return -0.5*G*(m[:,np.newaxis]*m[np.newaxis,:]*inv_r).sum()
+            if phi is not None and len(phi) == len(m) and np.array_equal(Model_System.phi_s, s):
+                return 0.5*(m*phi).sum()
+        else:
+            system = Model_System.current_system
+            # Masses made by a merge this step have no separations yet, nor do the others to them
+            if all(len(n.r_mag) == len(system) - 1 for n in system):
+                return 0.5*sum(n.m*n.phi for n in system)
+        return potential_energy(s, m, G) if self.exact else None
+
+    def measure(self, Model_System):
+        registry = getattr(Model_System, "registry", None)
+        if registry is not None:
+            s, v, m = registry.s, registry.v, registry.m
+        else:
+            system = Model_System.current_system
+            s = np.array([n.s for n in system], dtype=np.float64).reshape(-1,2)
+            v = np.array([n.v for n in system], dtype=np.float64).reshape(-1,2)
+            m = np.array([n.m for n in system], dtype=np.float64)
+        kinetic = 0.5*(m*(v**2).sum(axis=1)).sum()
+        potential = self.potential(Model_System, s, m)
+        if potential is None: return None
+        momentum = (m[:,np.newaxis]*v).sum(axis=0)
+        angular_momentum = (m*(s[:,0]*v[:,1] - s[:,1]*v[:,0])).sum()
+        # What the totals would be had no merges taken anything away
+        energy = kinetic + potential - Model_System.merge_energy
+        angular = angular_momentum - Model_System.merge_angular_momentum
+        if self.initial is None:
+            self.initial = {"energy": energy, "momentum": momentum, "angular_momentum": angular,
+                            "momentum_scale": (m*np.hypot(v[:,0], v[:,1])).sum() or 1}
+        initial = self.initial
+        relative = lambda x, x0: float((x - x0)/abs(x0)) if x0 else None
+        return {"time": Model_System.main.time_elapsed, "kinetic": float(kinetic),
+                "potential": float(potential), "energy": float(kinetic + potential),
+                "momentum": momentum.tolist(), "angular_momentum": float(angular_momentum),
+                "merge_energy": float(Model_System.merge_energy),
+                "merge_angular_momentum": float(Model_System.merge_angular_momentum),
+                "energy_drift": relative(energy, initial["energy"]),
+                "momentum_drift": float(np.hypot(*(momentum - initial["momentum"]))/initial["momentum_scale"]),
+                "angular_momentum_drift": relative(angular, initial["angular_momentum"])}
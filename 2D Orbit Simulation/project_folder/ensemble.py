@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from headless import *
+from Batched_Grav import *
+
+"""
+Ensembles of headless runs spread over a pool of worker processes, for stability studies
+of many perturbed variants of a scenario. Each run is described by a dict (see member):
+the scenario is named rather than passed as Mass instances, so every worker builds its
+own system and its own Gravitation, and only the plain numbers of the result come back.
+Results are yielded as each run finishes, which isn't the order they were given in.
+Small systems are better run in batches (Batched_Grav.py), many to a worker.
+
+    python ensemble.py --runs 200 --intruders 1 --integrator Wisdom_Holman
+                       --time-step 864000 --years 1000 --out ensemble.jsonl
+"""
+
+# One run of an ensemble, as handed to run_member
+def member(run, scenario="perturbed_solar_system", options={}, model="Vectorised_Gravitation",
+           integrator=None, collisions=False, time_step=None, steps=None, years=None,
+           center_object_ID=None):
+    return {"run": run, "scenario": scenario, "options": options, "model": model,
+            "integrator": integrator, "collisions": collisions, "time_step": time_step,
+            "steps": steps, "years": years, "center_object_ID": center_object_ID}
+
+
+# Runs in a worker. Masses are numbered from 0 for every run so their IDs don't depend
+# on which worker the run landed on or what it ran before.
+def run_member(job):
+    Mass.id = 0
+    system = SCENARIOS[job["scenario"]](**job["options"])
+    integrator = INTEGRATORS[job["integrator"]]() if job["integrator"] else None
+    collisions = Collision_Queue() if job["collisions"] else None
+    Model_System = build(system, MODELS[job["model"]], integrator, collisions,
+                         job["time_step"], job["center_object_ID"])
+    main, steps = Model_System.main, job["steps"]
+    if steps is None: steps = math.ceil(job["years"]*YEAR/Model_System.dT)
+    E0, merges, merged = energy(Model_System), [], 0
+    start = time.perf_counter()
+    for _ in range(steps):
+        if len(Model_System.current_system) == 0: break
+        step(Model_System)
+        main.time_elapsed += Model_System.dT
+        if len(Model_System.merged_into) != merged:
+            # Every step is checked, so these are the merges made during this one
+            into = {}
+            for ID in list(Model_System.merged_into)[merged:]:
+                into.setdefault(Model_System.merged_into[ID], []).append(ID)
+            for new, old in into.items():
+                # A mass which inherited the center object's ID keeps its entry
+                if Model_System.merged_into.get(new) == new and new not in old: old.append(new)
+            merges += [{"years": main.time_elapsed/YEAR, "into": new, "merged": old}
+                       for new, old in into.items()]
+            merged = len(Model_System.merged_into)
+    wall = time.perf_counter() - start
+    E = energy(Model_System)
+    final = Model_System.current_system
+    return {"run": job["run"], "options": job["options"], "years": main.time_elapsed/YEAR,
+            "wall_seconds": wall, "steps_per_sec": steps/wall if wall > 0 else None,
+            "bodies": len(final), "merges": merges,
+            "energy_error": E/E0 - 1 if E0 else None,
+            "final": {"ID": [n.ID for n in final], "m": [n.m for n in final],
+                      "s": [list(n.s) for n in final], "v": [list(n.v) for n in final]}}
+
+
+# Runs several jobs in a worker as one Batched_Gravitation. They must differ only in their
+# scenario and options. Returns a list of results in the same form as run_member.
+def run_batch(jobs):
+    shared = ("model", "integrator", "collisions", "time_step", "steps", "years", "center_object_ID")
+    assert all(job[key] == jobs[0][key] for job in jobs for key in shared)
+    assert jobs[0]["model"] == "Vectorised_Gravitation" and not jobs[0]["collisions"]
+    systems = []
+    for job in jobs:
+        Mass.id = 0
+        systems.append(SCENARIOS[job["scenario"]](**job["options"]))
+    job = jobs[0]
+    integrator = INTEGRATORS[job["integrator"]]() if job["integrator"] else None
+    Model_System = build(systems, Batched_Gravitation, integrator, None,
+                         job["time_step"], job["center_object_ID"])
+    main, steps = Model_System.main, job["steps"]
+    if steps is None: steps = math.ceil(job["years"]*YEAR/Model_System.dT)
+    E0, merges = Model_System.energies(), [[] for _ in jobs]
+    start = time.perf_counter()
+    for _ in range(steps):
+        step(Model_System)
+        main.time_elapsed += Model_System.dT
+        for b, new, old in Model_System.merge_events:
+            merges[b].append({"years": main.time_elapsed/YEAR, "into": new, "merged": old})
+        Model_System.merge_events = []
+    wall = time.perf_counter() - start
+    E = Model_System.energies()
+    return [{"run": job["run"], "options": job["options"], "years": main.time_elapsed/YEAR,
+             "wall_seconds": wall, "steps_per_sec": steps/wall if wall > 0 else None,
+             "bodies": int(Model_System.mask[b].sum()), "merges": merges[b],
+             "energy_error": float(E[b]/E0[b] - 1) if E0[b] else None,
+             "final": Model_System.final_state(b), "batch": len(jobs)}
+            for b, job in enumerate(jobs)]
+
+
+# Yields the result of each job as it finishes. jobs can be any iterable, including a
+# generator: no more than 2*workers runs (or batches) are waiting in the pool at once.
+# With batch > 1, consecutive jobs are grouped and each group is run by run_batch.
+def run_ensemble(jobs, workers=None, batch=1):
+    workers = workers or os.cpu_count() or 1
+    jobs, pending = iter(jobs), set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            while len(pending) < 2*workers:
+                group = [job for _, job in zip(range(batch), jobs)]
+                if not group: break
+                if batch == 1: pending.add(pool.submit(run_member, group[0]))
+                else: pending.add(pool.submit(run_batch, group))
+            if not pending: return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if batch == 1: yield future.result()
+                else: yield from future.result()
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Run many perturbed variants of a scenario.")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores")
+    parser.add_argument("--batch", type=int, default=1, help="runs stepped together by each worker")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run")
+    parser.add_argument("--mass-jitter", type=float, default=0.01)
+    parser.add_argument("--velocity-jitter", type=float, default=0.01)
+    parser.add_argument("--intruders", type=int, default=0)
+    parser.add_argument("--model", choices=sorted(MODELS), default="Vectorised_Gravitation")
+    parser.add_argument("--integrator", choices=sorted(INTEGRATORS), default=None)
+    parser.add_argument("--collisions", action="store_true", help="use Collision_Queue")
+    parser.add_argument("--time-step", type=float, default=None, help="seconds per step")
+    parser.add_argument("--center", type=int, default=0, help="center_object_ID")
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument("--steps", type=int)
+    length.add_argument("--years", type=float)
+    parser.add_argument("--out", default="-", help="JSON lines file, - for stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    jobs = (member(run, options={"seed": args.seed + run, "mass_jitter": args.mass_jitter,
+                                 "velocity_jitter": args.velocity_jitter,
+                                 "intruders": args.intruders},
+                   model=args.model, integrator=args.integrator, collisions=args.collisions,
+                   time_step=args.time_step, steps=args.steps, years=args.years,
+                   center_object_ID=args.center)
+            for run in range(args.runs))
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        for result in run_ensemble(jobs, args.workers, args.batch):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout: out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import sys
+import json
+import time
+import argparse
+from scenarios import *
+from Vectorised_Grav import *
+from Barnes_Hut import *
+from Particle_Mesh import *
+from Parallel_Grav import *
+from recorder import *
+import checkpoint
+from diagnostics import *
+from profiler import *
+
+"""
+Headless entry point for batch runs. A Gravitation backend is built from a scenario and
+driven through the same nine phases as Main.update_position as fast as it will go, with
+no window, font or image, so nothing from pygame is imported. Every interval steps one
+JSON line of metrics is written: steps/sec over the interval, body count, masses merged
+so far and the total energy with its drift since the start. With --record the state is
+also written every few steps to a recording which main.py can replay (recorder.py).
+With --checkpoint the run is saved every so often and at the end, and --resume carries
+on from such a checkpoint (checkpoint.py) instead of starting a scenario. With --monitor
+each line also carries the energy, momentum and angular momentum drift measured by a
+Conservation_Monitor (diagnostics.py), with the changes made by merges taken out. With
+--profile every phase is timed (profiler.py) and the breakdown dumped at the end.
+
+    python headless.py --scenario random_cluster --N 1000 --model Barnes_Hut_Gravitation
+                       --integrator Leapfrog --time-step 86400 --years 100 --out run.jsonl
+"""
+
+MODELS = {model.__name__: model for model in
+          (Gravitation, Vectorised_Gravitation, Tiled_Gravitation, Barnes_Hut_Gravitation,
+           Mesh_Gravitation, Parallel_Gravitation)}
+INTEGRATORS = {integrator.__name__: integrator for integrator in
+               (Euler, Leapfrog, Velocity_Verlet, Yoshida4, Wisdom_Holman, Block_Leapfrog)}
+
+
+# Stand-in for Main carrying only what the Gravitation backends read from it
+class Headless_Main:
+    G = G
+    TIME_LAPSE = 1
+    screen_width, screen_height = 700, 700
+    def __init__(self, input=[], center_object_ID=None):
+        self.input = input
+        self.center_object_ID = center_object_ID
+        if len(self.input) == 0: self.center_object_ID = None
+        self.time_elapsed = 0
+
+
+def step(Model_System, profiler=None):
+    if profiler is not None: return profiler.step(Model_System)
+    Model_System.mass_network()
+    Model_System.get_neighbours()
+    Model_System.r_vectors()
+    Model_System.R_mag()
+    Model_System.assymilate()
+    Model_System.g_vectors()
+    Model_System.resultant_g()
+    if Model_System.monitor is not None: Model_System.monitor.observe(Model_System)
+    Model_System.calc_velocity()
+    Model_System.reposition()
+
+
+# Read from the registry of the array backends and from the Mass instances of the list one
+def energy(Model_System):
+    if isinstance(Model_System, Vectorised_Gravitation):
+        registry = Model_System.registry
+        return total_energy(registry.s, registry.v, registry.m, Model_System.main.G)
+    bodies = Model_System.current_system
+    s = np.array([n.s for n in bodies], dtype=np.float64).reshape(-1,2)
+    v = np.array([n.v for n in bodies], dtype=np.float64).reshape(-1,2)
+    m = np.array([n.m for n in bodies], dtype=np.float64)
+    return total_energy(s, v, m, Model_System.main.G)
+
+
+def build(system, model=Vectorised_Gravitation, integrator=None, collisions=None,
+          time_step=None, center_object_ID=None):
+    main = Headless_Main(input=system, center_object_ID=center_object_ID)
+    if issubclass(model, Vectorised_Gravitation):
+        # Past the list backend's limit the per-step collision test merges planets which
+        # only pass within a step's travel of each other, so Collision_Queue is used
+        if collisions is None and model.collisions is None and time_step is not None \
+           and time_step > Gravitation.max_time_step:
+            collisions = Collision_Queue()
+        Model_System = model(main, integrator, collisions)
+    else:
+        assert integrator is None and collisions is None
+        Model_System = model(main)
+    if time_step is not None:
+        assert time_step > 0 and time_step <= Model_System.max_time_step
+        Model_System.time_step = time_step
+        Model_System.dT = time_step*main.TIME_LAPSE
+    return Model_System
+
+
+# Advances the model by a number of steps or simulated years, yielding a dict of metrics
+# every interval steps and at the end. Time spent on the energy isn't counted in steps/sec.
+# Given a Recorder, the state is recorded at the start and every record_every steps.
+# Given an Auto_Checkpoint, it is ticked every step and saved once more at the end.
+def run(Model_System, steps=None, years=None, interval=100, with_energy=True,
+        recorder=None, record_every=1, checkpointer=None, profiler=None):
+    assert (steps is None) != (years is None) and interval > 0
+    main = Model_System.main
+    if steps is None: steps = math.ceil(years*YEAR/Model_System.dT)
+    E0 = energy(Model_System) if with_energy else None
+    if recorder is not None: recorder.record(main.time_elapsed, Model_System)
+    done, wall = 0, 0
+    while done < steps:
+        count = min(interval, steps - done)
+        start = time.perf_counter()
+        for k in range(done + 1, done + count + 1):
+            if len(Model_System.current_system) > 0: step(Model_System, profiler)
+            main.time_elapsed += Model_System.dT
+            if recorder is not None and k % record_every == 0:
+                recorder.record(main.time_elapsed, Model_System)
+            if checkpointer is not None: checkpointer.tick(Model_System)
+        seconds = time.perf_counter() - start
+        done, wall = done + count, wall + seconds
+        record = {"step": done, "years": main.time_elapsed/YEAR, "wall_seconds": wall,
+                  "steps_per_sec": count/seconds if seconds > 0 else None,
+                  "bodies": len(Model_System.current_system),
+                  "merges": len(Model_System.merged_into)}
+        if with_energy:
+            E = energy(Model_System)
+            record["energy"] = E
+            record["energy_error"] = E/E0 - 1 if E0 else None
+        if Model_System.monitor is not None: record["conservation"] = Model_System.monitor.latest
+        if recorder is not None: recorder.flush()
+        if checkpointer is not None and done == steps: checkpointer.save(Model_System)
+        yield record
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Run the orbit simulation without a window.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="solar_system")
+    parser.add_argument("--N", type=int, default=100, help="masses in random_cluster and collapse")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random scenarios")
+    parser.add_argument("--model", choices=sorted(MODELS), default=None,
+                        help="defaults to Vectorised_Gravitation, or the checkpoint's with --resume")
+    parser.add_argument("--integrator", choices=sorted(INTEGRATORS), default=None)
+    parser.add_argument("--collisions", action="store_true",
+                        help="use Collision_Queue, always the case with --time-step over 10000")
+    parser.add_argument("--time-step", type=float, default=None,
+                        help="seconds per step, over 10000 needs a symplectic --integrator")
+    parser.add_argument("--center", type=int, default=None, help="center_object_ID")
+    length = parser.add_mutually_exclusive_group(required=True)
+    length.add_argument("--steps", type=int)
+    length.add_argument("--years", type=float)
+    parser.add_argument("--interval", type=int, default=100, help="steps between records")
+    parser.add_argument("--no-energy", action="store_true", help="skip the O(N^2) energy sum")
+    parser.add_argument("--monitor", type=int, default=None, metavar="STEPS",
+                        help="check energy and momentum conservation every STEPS steps")
+    parser.add_argument("--profile", nargs="?", const="-", default=None, metavar="PATH",
+                        help="time every phase, printing the breakdown to stderr at the end or writing it to PATH")
+    parser.add_argument("--out", default="-", help="JSON lines file, - for stdout")
+    parser.add_argument("--record", default=None, help="directory to record the run in")
+    parser.add_argument("--record-every", type=int, default=1, help="steps between recorded frames")
+    parser.add_argument("--checkpoint", default=None, help="file to checkpoint the run in")
+    parser.add_argument("--checkpoint-every", type=float, default=300, help="wall seconds between checkpoints")
+    parser.add_argument("--resume", default=None, help="checkpoint to carry on from")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.resume:
+        Model_System = checkpoint.load(args.resume, Headless_Main(),
+                                       MODELS[args.model] if args.model else None)
+    else:
+        if args.scenario in ("random_cluster", "collapse"): system = SCENARIOS[args.scenario](args.N, args.seed)
+        elif args.scenario == "perturbed_solar_system": system = perturbed_solar_system(args.seed)
+        else: system = SCENARIOS[args.scenario]()
+        integrator = INTEGRATORS[args.integrator]() if args.integrator else None
+        collisions = Collision_Queue() if args.collisions else None
+        Model_System = build(system, MODELS[args.model or "Vectorised_Gravitation"], integrator,
+                             collisions, args.time_step, args.center)
+    if args.monitor: Model_System.monitor = Conservation_Monitor(args.monitor)
+    checkpointer = checkpoint.Auto_Checkpoint(args.checkpoint, args.checkpoint_every) \
+                   if args.checkpoint else None
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    recorder = Recorder(args.record) if args.record else None
+    profiler = Stage_Profiler() if args.profile else None
+    try:
+        for record in run(Model_System, args.steps, args.years, args.interval, not args.no_energy,
+                          recorder, args.record_every, checkpointer, profiler):
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout: out.close()
+        if recorder is not None: recorder.close()
+        # stdout may be carrying the records
+        if profiler is not None and args.profile == "-": print(profiler.report(), file=sys.stderr)
+        elif profiler is not None: profiler.dump(args.profile)
+
+
+if __name__ == "__main__":
+    main()
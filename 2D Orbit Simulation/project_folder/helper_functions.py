@@ -12,3 +12,20 @@ def translate_points_on_screen(pts=(0, 0), WIDTH=1, HEIGHT=1, screen_scale=1):
     y = (pts[1]-0.5*HEIGHT)/(0.5*WIDTH)
     position = [x*screen_scale, -y*screen_scale]
     return position
+
+
+# Union-find: groups the items of every pair (a, b) into disjoint clusters.
+# Returns {item: root}, where items sharing a root belong to the same cluster.
+def clusters(pairs):
+    parent = {}
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+    for a, b in pairs:
+        parent.setdefault(a, a)
+        parent.setdefault(b, b)
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b: parent[root_b] = root_a
+    return {a: find(a) for a in parent}
@@ -0,0 +1,212 @@
+import numpy as np
+from array_functions import *
+
+"""
+Integrators for the array backends (Vectorised_Gravitation and its subclasses).
+Each one takes over phases 7. and 8. of the model: calc_velocity and reposition.
+model.gR always holds the field at the start of the step. Integrators which finish a
+step with a fresh field leave it in model.gR and set model.gR_current, so the next
+g_vectors doesn't repeat the force pass.
+Euler is the original first order update. The others are symplectic and second or fourth
+order, so they keep orbits closed with steps far larger than Euler can manage.
+Wisdom_Holman goes further for systems dominated by one mass.
+Steps beyond Euler's max_time_step need collisions=Collision_Queue() on the model, as the
+per-step distance test merges planets which only pass within a step's travel of each
+other (build in headless.py picks it for such steps). """
+
+class Euler:
+    max_time_step = 10**4
+    def calc_velocity(self, model, dT):
+        model.v += model.gR*dT
+
+    def reposition(self, model, dT):
+        model.s += model.v*dT
+        model.gR_current = False
+
+
+# Kick-drift-kick
+class Leapfrog(Euler):
+    max_time_step = 10**6
+    def calc_velocity(self, model, dT):
+        pass
+
+    def kick_drift_kick(self, model, dT):
+        model.v += 0.5*model.gR*dT
+        model.s += model.v*dT
+        model.gR = model.accelerations(model.s)
+        model.v += 0.5*model.gR*dT
+
+    def reposition(self, model, dT):
+        self.kick_drift_kick(model, dT)
+        model.gR_current = True
+
+
+class Velocity_Verlet(Leapfrog):
+    def reposition(self, model, dT):
+        model.s += model.v*dT + 0.5*model.gR*dT**2
+        g = model.accelerations(model.s)
+        model.v += 0.5*(model.gR + g)*dT
+        model.gR = g
+        model.gR_current = True
+
+
+# Three leapfrog steps of w1*dT, w0*dT and w1*dT cancel the third order error terms
+class Yoshida4(Leapfrog):
+    w1 = 1/(2 - 2**(1/3))
+    w0 = -2**(1/3)/(2 - 2**(1/3))
+    def reposition(self, model, dT):
+        for w in (self.w1, self.w0, self.w1):
+            self.kick_drift_kick(model, w*dT)
+        model.gR_current = True
+
+
+# Stumpff functions C(z) and S(z), with their series used near z = 0
+def stumpff(z):
+    small = np.abs(z) < 1e-6
+    zs = np.where(small, 1, z)
+    root = np.sqrt(np.abs(zs))
+    C = np.where(zs > 0, (1 - np.cos(root))/zs, (np.cosh(root) - 1)/-zs)
+    S = np.where(zs > 0, (root - np.sin(root))/root**3, (np.sinh(root) - root)/root**3)
+    C = np.where(small, 1/2 - z/24, C)
+    S = np.where(small, 1/6 - z/120, S)
+    return C, S
+
+
+# Advances each (r, v) along its two body orbit about a mass with mu = G*M for time dT,
+# using universal variables so bound and unbound orbits are handled alike.
+def kepler_drift(r, v, mu, dT, tolerance=1e-13, max_iterations=50):
+    r0 = np.hypot(r[:,0], r[:,1])
+    vr0 = (r*v).sum(axis=1)/r0
+    alpha = 2/r0 - (v**2).sum(axis=1)/mu
+    sqrt_mu = np.sqrt(mu)
+    chi = sqrt_mu*np.abs(alpha)*dT
+    chi = np.where(alpha > 0, chi, sqrt_mu*dT/r0)
+    for _ in range(max_iterations):
+        z = alpha*chi**2
+        C, S = stumpff(z)
+        F = r0*vr0/sqrt_mu*chi**2*C + (1 - alpha*r0)*chi**3*S + r0*chi - sqrt_mu*dT
+        dF = r0*vr0/sqrt_mu*chi*(1 - z*S) + (1 - alpha*r0)*chi**2*C + r0
+        step = F/dF
+        chi -= step
+        if np.all(np.abs(step) <= tolerance*np.maximum(np.abs(chi), 1)): break
+    z = alpha*chi**2
+    C, S = stumpff(z)
+    f = 1 - chi**2/r0*C
+    g = dT - chi**3/sqrt_mu*S
+    r_new = f[:,np.newaxis]*r + g[:,np.newaxis]*v
+    r_mag = np.hypot(r_new[:,0], r_new[:,1])
+    f_dot = sqrt_mu/(r_mag*r0)*(z*S - 1)*chi
+    g_dot = 1 - chi**2/r_mag*C
+    v_new = f_dot[:,np.newaxis]*r + g_dot[:,np.newaxis]*v
+    return r_new, v_new
+
+
+"""
+Wisdom-Holman mapping in democratic heliocentric coordinates, for systems dominated by
+one mass: the body with center_object_ID if there is one, otherwise the heaviest.
+Each body's orbit about the central mass is followed exactly by kepler_drift and only
+the much weaker pulls between the other bodies are applied as kicks, so steps of days
+to weeks keep the energy error bounded. """
+
+class Wisdom_Holman(Leapfrog):
+    max_time_step = 10**7
+    def central_index(self, model):
+        row = model.registry.index.get(model.main.center_object_ID)
+        return int(np.argmax(model.m)) if row is None else row
+
+    # Pull of every non-central body on the others
+    def interaction(self, Q, m, G):
+        return direct_accelerations(Q, m, G)
+
+    def reposition(self, model, dT):
+        if len(model.m) < 2:
+            Euler.reposition(self, model, dT)
+            return
+        G, c = model.main.G, self.central_index(model)
+        others = np.arange(len(model.m)) != c
+        m_c, m, M = model.m[c], model.m[others], model.m.sum()
+        s_cm = (model.m[:,np.newaxis]*model.s).sum(axis=0)/M
+        v_cm = (model.m[:,np.newaxis]*model.v).sum(axis=0)/M
+        Q = model.s[others] - model.s[c]
+        V = model.v[others] - v_cm
+        a = self.interaction(Q, m, G)
+        V += 0.5*dT*a
+        Q += 0.5*dT*(m[:,np.newaxis]*V).sum(axis=0)/m_c
+        Q, V = kepler_drift(Q, V, G*m_c, dT)
+        Q += 0.5*dT*(m[:,np.newaxis]*V).sum(axis=0)/m_c
+        a = self.interaction(Q, m, G)
+        V += 0.5*dT*a
+        model.s[c] = s_cm - (m[:,np.newaxis]*Q).sum(axis=0)/M
+        model.s[others] = Q + model.s[c]
+        model.v[others] = V + v_cm
+        model.v[c] = v_cm - (m[:,np.newaxis]*V).sum(axis=0)/m_c
+        # The full field is the central pull plus the interactions just computed
+        Q_mag3 = np.hypot(Q[:,0], Q[:,1])[:,np.newaxis]**3
+        model.gR[others] = a - G*m_c*Q/Q_mag3
+        model.gR[c] = G*(m[:,np.newaxis]*Q/Q_mag3).sum(axis=0)
+        model.gR_current = True
+
+
+"""
+Leapfrog with individual power-of-two block timesteps. Each step of dT is split into
+2**max_level ticks and every mass takes steps of dT/2**level, where its level comes from
+its acceleration and jerk (the change in acceleration between its last two kicks):
+dt = eta*|a|/|jerk|. All masses drift together between ticks, which is cheap, but the
+force pass and kicks only involve the masses whose step ends on that tick.
+A mass can always move to a shorter step, and to a longer one whenever the current tick
+is on that longer step's boundary. All masses line up again at the end of dT.
+The instance keeps the levels between steps, so use one instance per model. They are
+kept by registry serial, so a merge or spawn leaves every other mass its own level and
+new masses start on the shortest step. """
+
+class Block_Leapfrog(Leapfrog):
+    max_level = 6
+    eta = 0.05
+    def __init__(self):
+        self.level, self.serial = None, None
+
+    def choose_level(self, dT, a, jerk):
+        a_mag, jerk_mag = np.hypot(a[:,0], a[:,1]), np.hypot(jerk[:,0], jerk[:,1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            level = np.ceil(np.log2(dT*jerk_mag/(self.eta*a_mag)))
+        return np.clip(np.nan_to_num(level, nan=0, posinf=self.max_level, neginf=0),
+                       0, self.max_level).astype(np.int64)
+
+    def reposition(self, model, dT):
+        N, L = len(model.m), self.max_level
+        ticks, h = 2**L, dT/2**L
+        serial = model.registry.serial
+        if self.level is None or not np.array_equal(self.serial, serial):
+            level = np.full(N, L, dtype=np.int64)
+            if self.level is not None and len(self.serial):
+                # Serials only grow, so the old ones are still in order
+                old = np.minimum(np.searchsorted(self.serial, serial), len(self.serial) - 1)
+                kept = self.serial[old] == serial
+                level[kept] = self.level[old[kept]]
+            self.level, self.serial = level, serial.copy()
+        a = model.gR.copy()
+        step = 2**(L - self.level)
+        model.v += 0.5*a*(step*h)[:,np.newaxis]
+        next_tick, t = step.copy(), 0
+        self.force_passes = 0
+        while t < ticks:
+            t_next = next_tick.min()
+            model.s += model.v*((t_next - t)*h)
+            t = t_next
+            active = np.flatnonzero(next_tick == t)
+            a_new = model.accelerations(model.s, rows=active)
+            self.force_passes += len(active)/N
+            dt = (step[active]*h)[:,np.newaxis]
+            model.v[active] += 0.5*a_new*dt
+            level = self.choose_level(dT, a_new, (a_new - a[active])/dt)
+            a[active] = a_new
+            self.level[active] = level
+            if t == ticks: break
+            # Largest step allowed from this tick is the largest power of two dividing t
+            new_step = np.minimum(2**(L - level), t & -t)
+            self.level[active] = L - np.log2(new_step).astype(np.int64)
+            step[active] = new_step
+            model.v[active] += 0.5*a_new*(new_step*h)[:,np.newaxis]
+            next_tick[active] = t + new_step
+        model.gR = a
+        model.gR_current = True
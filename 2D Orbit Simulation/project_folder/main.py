@@ -1,47 +1,68 @@
+import time
+import argparse
 import pygame
 from pygame.locals import*
 import random
 from mass import*
 from Newtonian_Grav import*
+from Vectorised_Grav import*
+from Barnes_Hut import*
+from Particle_Mesh import*
+from Parallel_Grav import*
+from recorder import*
+import checkpoint
+from physics_thread import*
+from diagnostics import*
+from profiler import*
 import helper_functions
+import scenarios
 
 
 
 class Main:                           
-    AU, G = 1.496*10**11, 6.67430*10**-11                                              
+    AU, G = scenarios.AU, scenarios.G                                              
     SCREEN_SCALE = 4                       
     DOT_SCALE = 1                           
     TIME_LAPSE = 1                          
     SPACE_COLOUR = (0,0,10) 
+    MODEL = Gravitation                     # Vectorised_, Tiled_, Parallel_, Barnes_Hut_ or Mesh_Gravitation for larger systems.
+                                            # Only these keep the masses in a Body_Registry, the list backend keeps per-mass lists
     screen_width, screen_height = 700, 700  
+    RECORD = None                           # Directory to record the run in (recorder.py)
+    REPLAY = None                           # Directory of a recording to play back instead
+    CHECKPOINT = None                       # File to checkpoint the run in, and on closing (checkpoint.py)
+    CHECKPOINT_EVERY = 300                  # Wall seconds between checkpoints
+    RESUME = None                           # Checkpoint to carry on from instead of starting afresh
+    FPS = 60                                # Frames drawn per second, also used in replays
+    PHYSICS_RATE = 1000                     # Steps per second, None for as many as possible
+    SUBSTEPS = 1                            # Fast-forward: steps per physics tick, ] and [ double and halve it
+    MAX_SUBSTEPS = 4096
+    MAX_SPRITES = 4096                      # Dot sprites cached before the cache is emptied
+    LOD_BODIES = 20000                      # Above this many masses on screen the smallest dots
+    LOD_RADIUS = 1                          # (radius <= LOD_RADIUS) are rastered, see raster
+    TRAILS = True                           # Orbit trails, t turns them on and off
+    TRAIL_LENGTH = 64                       # Positions kept for each mass
+    TRAIL_FADE = 0.97                       # Brightness kept by a trail from one frame to the next
+    MAX_TRAILS = 2000                       # No trails for more masses than this
+    ZOOM = 1.25                             # Change of scale for each step of the mouse wheel
+    MONITOR = 10                            # Steps between conservation checks (diagnostics.py), None for none
+    SHOW_CONSERVATION = False               # Drift readout in the corner, e turns it on and off
+    PROFILE = None                          # Time every phase (profiler.py), p prints the breakdown and it is
+                                            # dumped on closing: "-" to print it, else a JSON file to write
     assert DOT_SCALE < 5 and DOT_SCALE >=1
     assert TIME_LAPSE >= 0 and TIME_LAPSE <=1
                                                               
-    v_Earth = 29789                         
-    v_Merc = 29789*(1/0.378)**0.5           
-    v_Ven = 29789*(1/0.72)**0.5             
-    v_Mar = 29789*(1/1.5)**0.5
-    v_Jup = 29789*(1/5.2)**0.5
-    v_Sat = 29789*(1/9.5)**0.5
-    v_Ura = 29789*(1/19)**0.5
-    v_Nep = 29789*(1/30)**0.5
     Mass.distance_unit = SCREEN_SCALE*AU     
     Mass.scale *= DOT_SCALE 
-    SOLAR_SYSTEM = [Mass(m=1.989*10**30, s=[0,0],       v=[0,0],      colour=(255,255,250), avg_density=1408),
-                    Mass(m=3.285*10**23, s=[0.378*AU,0],v=[0,v_Merc], colour=(200,180,0),   avg_density=5429),
-                    Mass(m=4.867*10**24, s=[0.72*AU,0], v=[0,v_Ven],  colour=(200,180,0),   avg_density=5243),
-                    Mass(m=5.972*10**24, s=[AU,0],      v=[0,v_Earth],colour=(80,180,255),  avg_density=5514),
-                    Mass(m=6.39*10**23,  s=[1.5*AU,0],  v=[0,v_Mar],  colour=(200,100,50),  avg_density=3934),
-                    Mass(m=1.898*10**27, s=[-5.2*AU,0], v=[0,-v_Jup], colour=(200,150,100), avg_density=1326),
-                    Mass(m=5.972*10**24, s=[9.5*AU,0],  v=[0,v_Sat],  colour=(150,150,70),  avg_density=687),
-                    Mass(m=8.681*10**25, s=[19*AU,0],   v=[0,v_Ura], colour=(0,100,150),   avg_density=1270),
-                    Mass(m=1.024*10**26, s=[30*AU,0],  v=[0,-v_Nep], colour=(0,100,255),   avg_density=1638),]
+    SOLAR_SYSTEM = scenarios.solar_system()
  
     def __init__(self):  
         pygame.init()
         self.size = (self.screen_width, self.screen_height) 
         self.screen = pygame.display.set_mode(self.size)
-        self.lines = pygame.Surface(self.size)   
+        self.lines = pygame.Surface(self.size)   # Trails, see update_trails
+        self.back_buffer = pygame.Surface(self.size)
+        self.sprites = {}                    # Dots drawn so far, see sprite
         icon = pygame.image.load("Red Dwarf.png")
         pygame.display.set_icon(icon)
         self.run = True
@@ -60,29 +81,47 @@ class Main:
         if len(self.input) == 0: self.center_object_ID = None 
         self.time_elapsed, self.recent_event_log, self.recent_event_times = 0, [], []
         self.mouse_history = []   
+        self.substeps = self.SUBSTEPS
+        self.sim_rate, self.rate_mark = None, (time.perf_counter(), 0)
+        self.trails = self.TRAILS
+        self.clear_trails()
+        self.show_conservation = self.SHOW_CONSERVATION
         
 
     def caption(self, years=False):
         title = "||RED DWARF||"
         title += " "*50
         if years and self.started: title += f"| Time: {round(self.time_elapsed/(365*24*3600),1)} calendar years |"
+        if years and self.started and self.sim_rate is not None:
+            title += f" x{self.substeps}: {self.sim_rate:.3g} simulated s per s |"
         pygame.display.set_caption(title)
 
-    def frame_of_reference(self, Model_System):
-        if self.center_object_ID is not None and len(self.input)>0:
-            if len(Model_System.new_ids) > 0:
-                index = Model_System.new_ids.index(self.center_object_ID)
-                center = Model_System.current_system[index].s
-            else: 
-                center = self.input[self.center_object_ID].s
-        else: center=[0,0]
-        return center
-    
+    # Simulated seconds per wall second, measured over the last half second or so
+    def measure_rate(self):
+        wall, elapsed = time.perf_counter(), self.time_elapsed
+        wall0, elapsed0 = self.rate_mark
+        if wall - wall0 < 0.5: return
+        if elapsed >= elapsed0: self.sim_rate = (elapsed - elapsed0)/(wall - wall0)
+        self.rate_mark = (wall, elapsed)
 
-    def event_loop(self, Model_System, mass_range=[10**27, 10**30]):
+    def event_loop(self, physics, mass_range=[10**27, 10**30]):
         for event in pygame.event.get():
             if event.type == pygame.QUIT: 
                     self.run = False
+            if event.type == KEYDOWN:
+                if event.key in (K_RIGHTBRACKET, K_EQUALS, K_KP_PLUS):
+                    self.substeps = min(2*self.substeps, self.MAX_SUBSTEPS)
+                elif event.key in (K_LEFTBRACKET, K_MINUS, K_KP_MINUS):
+                    self.substeps = max(self.substeps//2, 1)
+                elif event.key == K_t:
+                    self.trails = not self.trails
+                    self.clear_trails()
+                elif event.key == K_e:
+                    self.show_conservation = not self.show_conservation
+                elif event.key == K_p and self.profiler is not None:
+                    self.profiler.dump()
+            if event.type == MOUSEWHEEL:
+                Mass.distance_unit *= self.ZOOM**-event.y
             if len(self.recent_event_log) >=2:
                 self.recent_event_log = []
                 self.recent_event_times=[]
@@ -108,14 +147,16 @@ class Main:
                                                 HEIGHT=self.screen_height, screen_scale=Mass.distance_unit)
                     
                     v_x_adjust, v_y_adjust = None,None
+                    state = None
                     if self.center_object_ID is not None:
-                        for n in Model_System.current_system:
-                            if n.ID == self.center_object_ID:
-                                s0[0] = s0[0]+n.s[0]
-                                s0[1] = s0[1]+n.s[1]
-                                s1[0] = s1[0]+n.s[0]
-                                s1[1] = s1[1]+n.s[1]
-                                v_x_adjust, v_y_adjust = n.v[0], n.v[1]
+                        state = physics.state(self.center_object_ID)
+                    if state is not None:
+                        n_s, n_v = state
+                        s0[0] = s0[0]+n_s[0]
+                        s0[1] = s0[1]+n_s[1]
+                        s1[0] = s1[0]+n_s[0]
+                        s1[1] = s1[1]+n_s[1]
+                        v_x_adjust, v_y_adjust = n_v[0], n_v[1]
  
                     ds_x, ds_y = s1[0]-s0[0], s1[1]-s0[1]
                     dt = abs(t1-t0)
@@ -132,14 +173,9 @@ class Main:
                             vx+=v_x_adjust
                             vy+=v_y_adjust
                         s, v = s1, [vx, vy]
-                        M = Mass(m=m, s=s, v=v, colour=colour, avg_density=1400)
-                        Model_System.current_system.append(M)   
+                        physics.spawn(m=m, s=s, v=v, colour=colour, avg_density=1400)
 
-    def draw(self, Model_System):
-        zoom_out = (1/(Mass.distance_unit)) 
-        lines = pygame.Surface(self.size) 
-        lines.fill(self.SPACE_COLOUR)
-        points, radii, colours = [],[],[]
+    def draw(self, physics):
         if not self.drawing:
             font1 = pygame.font.SysFont("Arial", 36)
             font2 = pygame.font.SysFont("Cambria", 25)
@@ -152,22 +188,150 @@ class Main:
             self.screen.blit(text_surface1,coordinates1)
             self.screen.blit(text_surface2,coordinates2)
         else:
-            center = self.frame_of_reference(Model_System)
-            for n in Model_System.current_system:
-                assert type(n) == Mass
-                screen_coordinates = helper_functions.pygame_array([zoom_out*(n.s[0]-center[0])],
-                                                [zoom_out*(n.s[1]-center[1])], 
-                                                self.screen_width, self.screen_height)[0]
-                points.append(screen_coordinates)
-                radii.append(n.dot_diameter)
-                colours.append(n.colour)
-            for n in range(len(points)):
-                pygame.draw.circle(lines,colours[n], points[n], radii[n])
-            self.screen.blit(lines, (0, 0))
+            ID, s, D, m, colours, row = physics.interpolated()
+            center = [0,0] if row is None else s[row]
+            trails = self.trails and len(ID) <= self.MAX_TRAILS
+            if trails: self.update_trails(ID, s, colours, center)
+            self.draw_bodies(s, np.maximum(Mass.scale*D/Mass.distance_unit, 1), colours, center, m, trails)
+            if self.show_conservation: self.draw_conservation(physics.Model_System.monitor)
+
+    # Relative drift in energy, momentum and angular momentum since monitoring began, as
+    # last measured by the physics thread's Conservation_Monitor
+    def draw_conservation(self, monitor):
+        latest = monitor.latest if monitor is not None else None
+        if latest is None: return
+        if not hasattr(self, "small_font"): self.small_font = pygame.font.SysFont("Arial", 14)
+        drift = lambda x: "n/a" if x is None else f"{x:+.2e}"
+        lines = [f"Energy drift: {drift(latest['energy_drift'])}",
+                 f"Momentum drift: {drift(latest['momentum_drift'])}",
+                 f"Angular momentum drift: {drift(latest['angular_momentum_drift'])}"]
+        for k, line in enumerate(lines):
+            self.screen.blit(self.small_font.render(line, True, (200,200,200)), (10, 10 + 16*k))
+
+    # Dots at positions s (in metres) relative to center. radii are the dot sizes given to
+    # pygame.draw.circle, which like it are cut down to whole pixels. Every position is
+    # mapped to the screen in one array operation, dots wholly off screen are dropped, and
+    # the rest are copies of a circle drawn once for each colour and size, all blitted in
+    # one call onto a back-buffer which is kept from frame to frame.
+    # With more than LOD_BODIES masses on screen the smallest dots are rastered instead.
+    def draw_bodies(self, s, radii, colours, center, m=None, trails=False):
+        x, y = self.to_screen(s, center)
+        r = np.maximum(np.asarray(radii, dtype=np.float64), 1).astype(np.int64)
+        on_screen = (x + r >= 0) & (x - r < self.screen_width) & (y + r >= 0) & (y - r < self.screen_height)
+        x, y, r = x[on_screen], y[on_screen], r[on_screen]
+        colours = np.asarray(colours).reshape(-1,3)[on_screen]
+        self.back_buffer.fill(self.SPACE_COLOUR)
+        if trails: self.back_buffer.blit(self.lines, (0, 0), special_flags=BLEND_RGB_ADD)
+        if len(x) > self.LOD_BODIES:
+            small = r <= self.LOD_RADIUS
+            weights = None if m is None else np.asarray(m, dtype=np.float64)[on_screen][small]
+            self.raster(x[small], y[small], colours[small], weights)
+            x, y, r, colours = x[~small], y[~small], r[~small], colours[~small]
+        rgb = colours.astype(np.int64)
+        key = r << 24 | rgb[:,0] << 16 | rgb[:,1] << 8 | rgb[:,2]
+        keys, which = np.unique(key, return_inverse=True)
+        sprites = [self.sprite(int(k)) for k in keys.tolist()]
+        corner_x, corner_y = (x.astype(np.int64) - r - 1).tolist(), (y.astype(np.int64) - r - 1).tolist()
+        self.back_buffer.blits([(sprites[k], (cx, cy)) for k, cx, cy in
+                                zip(which.tolist(), corner_x, corner_y)], doreturn=False)
+        self.screen.blit(self.back_buffer, (0, 0))
+
+    # Screen coordinates of positions s (in metres, N x 2 or more dimensions) about center
+    def to_screen(self, s, center):
+        zoom_out = (1/(Mass.distance_unit)) 
+        s, center = np.asarray(s, dtype=np.float64), np.asarray(center, dtype=np.float64)
+        x = 0.5*self.screen_width*zoom_out*(s[...,0]-center[...,0]) + 0.5*self.screen_width
+        y = -0.5*self.screen_width*zoom_out*(s[...,1]-center[...,1]) + 0.5*self.screen_height
+        return x, y
+
+    def clear_trails(self):
+        self.lines.fill((0,0,0))
+        self.trail = np.full((0, self.TRAIL_LENGTH, 2), np.nan)
+        self.trail_center = np.full((self.TRAIL_LENGTH, 2), np.nan)
+        self.trail_rows, self.trail_head, self.trail_view = {}, 0, None
+
+    # Trails are kept as a ring buffer of the last TRAIL_LENGTH positions of every mass
+    # (trail[row, k]), with the centre of the view when each was taken, and drawn onto
+    # self.lines, which is faded once a frame and added under the dots. Each frame only
+    # the newest segment of each trail is drawn. The whole layer is drawn again from the
+    # buffer only when the view changes, as then every old segment moves on screen.
+    def update_trails(self, ID, s, colours, center):
+        ID, center = ID.tolist(), np.asarray(center, dtype=np.float64)
+        if ID != list(self.trail_rows):
+            # Masses have merged or been added, so the rows are rearranged to suit
+            old = np.array([self.trail_rows.get(n, -1) for n in ID], dtype=np.int64)
+            trail = np.full((len(ID), self.TRAIL_LENGTH, 2), np.nan)
+            trail[old >= 0] = self.trail[old[old >= 0]]
+            self.trail, self.trail_rows = trail, dict(zip(ID, range(len(ID))))
+        previous = self.trail[:, self.trail_head].copy()
+        previous_center = self.trail_center[self.trail_head].copy()
+        self.trail_head = (self.trail_head + 1) % self.TRAIL_LENGTH
+        self.trail[:, self.trail_head], self.trail_center[self.trail_head] = s, center
+        dim = (np.asarray(colours, dtype=np.float64).reshape(-1,3)*0.6).astype(np.int64).tolist()
+        view = (self.center_object_ID, Mass.distance_unit)
+        if view != self.trail_view:
+            self.trail_view = view
+            self.redraw_trails(dim)
+            return
+        pixels = pygame.surfarray.pixels3d(self.lines)
+        np.multiply(pixels, self.TRAIL_FADE, out=pixels, casting="unsafe")
+        del pixels
+        x0, y0 = self.to_screen(previous, previous_center)
+        x1, y1 = self.to_screen(s, center)
+        for k in np.flatnonzero(np.isfinite(x0) & np.isfinite(y0)).tolist():
+            pygame.draw.line(self.lines, dim[k], (x0[k], y0[k]), (x1[k], y1[k]))
+
+    # Draws every stored segment, oldest first, dimmed as much as it would have faded by now
+    def redraw_trails(self, dim):
+        self.lines.fill((0,0,0))
+        row = self.trail_rows.get(self.center_object_ID)
+        # The new centre's own past positions give the view at the time of each sample
+        centers = self.trail[row] if row is not None else np.zeros_like(self.trail_center)
+        x, y = self.to_screen(self.trail, centers[np.newaxis])
+        L = self.TRAIL_LENGTH
+        for age in range(L - 1, 0, -1):
+            a, b = (self.trail_head - age) % L, (self.trail_head - age + 1) % L
+            fade = self.TRAIL_FADE**(age - 1)
+            ok = np.isfinite(x[:,a]) & np.isfinite(y[:,a]) & np.isfinite(x[:,b]) & np.isfinite(y[:,b])
+            for k in np.flatnonzero(ok).tolist():
+                pygame.draw.line(self.lines, [int(c*fade) for c in dim[k]],
+                                 (x[k,a], y[k,a]), (x[k,b], y[k,b]))
+
+    # Writes masses at screen positions x, y into the back-buffer as a histogram, one pixel
+    # per mass rather than a dot, with pygame.surfarray. Each lit pixel takes the mean colour
+    # of its masses, weighted by mass, and is brighter the more mass it holds relative to a
+    # typical one, so the work depends on the number of pixels far more than on the masses.
+    def raster(self, x, y, colours, m=None):
+        W, H = self.screen_width, self.screen_height
+        pixel = np.clip(x.astype(np.int64), 0, W - 1)*H + np.clip(y.astype(np.int64), 0, H - 1)
+        # A sample of a thousand or so is plenty to find a typical mass
+        weight = np.ones(len(pixel)) if m is None or len(m) == 0 else m/np.median(m[::len(m)//1000 + 1])
+        total = np.bincount(pixel, weights=weight, minlength=W*H)
+        lit = np.flatnonzero(total)
+        colour = np.column_stack([np.bincount(pixel, weights=weight*colours[:,k], minlength=W*H)[lit]
+                                  for k in range(3)])/total[lit,np.newaxis]
+        brightness = np.clip(0.4 + 0.2*np.log2(total[lit]), 0.25, 1)
+        pixels = pygame.surfarray.pixels3d(self.back_buffer)
+        pixels[lit//H, lit%H] = (colour*brightness[:,np.newaxis]).astype(np.uint8)
+        del pixels
+
+    # Circle for a key of (radius << 24 | red << 16 | green << 8 | blue), drawn once and cached
+    def sprite(self, key):
+        if key not in self.sprites:
+            if len(self.sprites) >= self.MAX_SPRITES: self.sprites.clear()
+            r, colour = key >> 24, ((key >> 16) & 255, (key >> 8) & 255, key & 255)
+            surface = pygame.Surface((2*r + 2, 2*r + 2))
+            surface.fill(self.SPACE_COLOUR)
+            surface.set_colorkey(self.SPACE_COLOUR)
+            pygame.draw.circle(surface, colour, (r + 1, r + 1), r)
+            self.sprites[key] = surface.convert()
+        return self.sprites[key]
 
 
     def update_position(self, Model_System):
-        if len(Model_System.current_system) > 0 and self.drawing:
+        if len(Model_System.current_system) > 0 and self.drawing and self.profiler is not None:
+            self.profiler.step(Model_System)
+        elif len(Model_System.current_system) > 0 and self.drawing:
             Model_System.mass_network()
             Model_System.get_neighbours()
             Model_System.r_vectors()
@@ -175,6 +339,7 @@ class Main:
             Model_System.assymilate()
             Model_System.g_vectors()
             Model_System.resultant_g()
+            if Model_System.monitor is not None: Model_System.monitor.observe(Model_System)
             Model_System.calc_velocity()
             Model_System.reposition()  
         if self.time_elapsed >= self.countdown and self.drawing == False: self.drawing=True
@@ -187,17 +352,119 @@ class Main:
     def clock_tick(self, Model):
         self.time_elapsed+=Model.dT
 
-    def main(self):
-        Model_System = Gravitation(self) 
-        while self.run:                  
-            self.caption(years=True)    
-            self.event_loop(Model_System, mass_range=[10**29,10**30])   
-            self.draw(Model_System)
-            self.frame_of_reference(Model_System)
+    # One tick of the physics thread: substeps steps, then anything that needs the state.
+    # Nothing is drawn and nothing put on screen between the steps.
+    def advance(self, Model_System):
+        for _ in range(self.substeps):
             self.update_position(Model_System)
             self.show_message()
             self.clock_tick(Model_System)
+        if self.started:
+            if self.recorder is not None: self.recorder.record(self.time_elapsed, Model_System)
+            if self.checkpointer is not None: self.checkpointer.tick(Model_System)
+
+    # Plays back a recording without computing any physics. Space pauses, the left and right
+    # arrows step one frame, Home and End go to either end, and clicking or dragging along
+    # the bar at the bottom seeks to that point in time. Frames are read straight from the
+    # memory-mapped file, and new ones are picked up if the run is still being recorded.
+    def replay(self):
+        trajectory = Trajectory(self.REPLAY)
+        clock = pygame.time.Clock()
+        bar = pygame.Rect(20, self.screen_height - 20, self.screen_width - 40, 6)
+        k, playing, seeking = 0, True, False
+        while self.run:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT: self.run = False
+                elif event.type == KEYDOWN:
+                    if event.key == K_SPACE: playing = not playing
+                    elif event.key == K_RIGHT: k, playing = k + 1, False
+                    elif event.key == K_LEFT: k, playing = k - 1, False
+                    elif event.key == K_HOME: k = 0
+                    elif event.key == K_END: k = len(trajectory) - 1
+                elif event.type == MOUSEBUTTONDOWN and bar.inflate(0, 20).collidepoint(event.pos):
+                    seeking = True
+                elif event.type == MOUSEBUTTONUP: seeking = False
+                if seeking and event.type in (MOUSEBUTTONDOWN, MOUSEMOTION) and len(trajectory) > 0:
+                    fraction = min(max((event.pos[0] - bar.x)/bar.width, 0), 1)
+                    k = trajectory.seek(trajectory.time[0] + fraction*trajectory.duration)
+            if k >= len(trajectory) - 1: trajectory.reload()
+            if len(trajectory) == 0:
+                clock.tick(self.FPS)
+                continue
+            k = min(max(k, 0), len(trajectory) - 1)
+            bodies = trajectory.frame(k)
+            center = [0,0]
+            if self.center_object_ID is not None:
+                row = np.flatnonzero(bodies["ID"] == self.center_object_ID)
+                if len(row) > 0: center = bodies["s"][row[0]]
+            radii = np.maximum(Mass.scale*bodies["D"]/Mass.distance_unit, 1)
+            self.draw_bodies(bodies["s"], radii, bodies["colour"], center, bodies["m"])
+            fraction = (trajectory.time[k] - trajectory.time[0])/trajectory.duration if trajectory.duration else 1
+            pygame.draw.rect(self.screen, (60,60,80), bar)
+            pygame.draw.rect(self.screen, (255,70,110), (bar.x, bar.y, fraction*bar.width, bar.height))
+            title = "||RED DWARF||" + " "*50
+            title += f"| Replay: {round(trajectory.time[k]/(365*24*3600),1)} calendar years |"
+            pygame.display.set_caption(title)
             pygame.display.update()
+            if playing and not seeking: k += 1
+            clock.tick(self.FPS)
+        pygame.quit()
+
+    # The physics runs in a Physics_Thread, which calls advance, while this loop handles
+    # input and draws FPS frames a second, so neither waits on the other.
+    def main(self):
+        if self.REPLAY is not None: return self.replay()
+        if self.RESUME is not None:
+            Model_System = checkpoint.load(self.RESUME, self)
+            self.drawing = self.started = True
+        else:
+            Model_System = self.MODEL(self) 
+        if self.MONITOR: Model_System.monitor = Conservation_Monitor(self.MONITOR)
+        # Model_System = Vectorised_Gravitation(self, integrator=Yoshida4(), collisions=Collision_Queue())
+        self.profiler = Stage_Profiler() if self.PROFILE is not None else None
+        self.recorder = Recorder(self.RECORD) if self.RECORD is not None else None
+        self.checkpointer = checkpoint.Auto_Checkpoint(self.CHECKPOINT, self.CHECKPOINT_EVERY) \
+                            if self.CHECKPOINT is not None else None
+        physics = Physics_Thread(Model_System, self.advance, self.PHYSICS_RATE)
+        physics.start()
+        clock = pygame.time.Clock()
+        while self.run:                  
+            self.measure_rate()
+            self.caption(years=True)    
+            if self.profiler is None:
+                self.event_loop(physics, mass_range=[10**29,10**30])   
+                self.draw(physics)
+                pygame.display.update()
+            else:
+                self.profiler.time("event_loop", self.event_loop, physics, mass_range=[10**29,10**30])
+                self.profiler.time("draw", self.draw, physics)
+                self.profiler.time("display", pygame.display.update)
+            if physics.error is not None: raise physics.error
+            clock.tick(self.FPS)
+        physics.stop()
+        if self.recorder is not None: self.recorder.close()
+        if self.checkpointer is not None and self.started: self.checkpointer.save(Model_System)
+        if self.profiler is not None: self.profiler.dump(None if self.PROFILE == "-" else self.PROFILE)
         pygame.quit()
-Main().main()
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Orbit simulation.")
+    parser.add_argument("replay", nargs="?", default=None, help="recording to play back")
+    parser.add_argument("--record", default=None, help="directory to record the run in")
+    parser.add_argument("--checkpoint", default=None, help="file to checkpoint the run in")
+    parser.add_argument("--checkpoint-every", type=float, default=Main.CHECKPOINT_EVERY,
+                        help="wall seconds between checkpoints")
+    parser.add_argument("--resume", default=None, help="checkpoint to carry on from")
+    parser.add_argument("--profile", nargs="?", const="-", default=None, metavar="PATH",
+                        help="time every phase, printing the breakdown on closing or writing it to PATH")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    Main.REPLAY, Main.RECORD, Main.RESUME = args.replay, args.record, args.resume
+    Main.CHECKPOINT, Main.CHECKPOINT_EVERY = args.checkpoint, args.checkpoint_every
+    Main.PROFILE = args.profile
+    Main().main()
 
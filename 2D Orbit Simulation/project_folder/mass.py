@@ -3,12 +3,17 @@ import math
 
 """
 Instances of the the following Mass class hold all the data 
-concerning the their whereabouts"""
+concerning the their whereabouts.
+Once a mass is added to a Body_Registry (registry.py) its position and velocity
+live in the registry's arrays and s and v read and write its row there."""
 
 class Mass:
     id=0                    
     distance_unit = 1       
     scale = 1000           
+    registry = None         
+    # The list backend gives each mass its own copies of these every step
+    others, v_mag, r, r_mag, g, gR = (),(),(),(),(),()
     def __init__(self,m=0,s=[0,0],v=[0,0], colour=(255,255,255), avg_density=1000):
         self.ID = Mass.id   
         Mass.id += 1
@@ -18,10 +23,39 @@ class Mass:
         self.initialise_data_structures()
     
     def initialise_data_structures(self):
-        self.others, self.v_mag, self.r = [],[],[]
-        self.r_mag, self.g, self.gR = [],[],[]
-        self.screen_points = []
         self.dot_diameter, self.real_diameter = self.calc_sphere_diam()
+
+    @property
+    def s(self):
+        if self.registry is None: return self._s
+        return self.registry.s[self.registry.index[self.ID]].tolist()
+
+    @s.setter
+    def s(self, s):
+        if self.registry is None: self._s = s
+        else: self.registry.s[self.registry.index[self.ID]] = s
+
+    @property
+    def v(self):
+        if self.registry is None: return self._v
+        return self.registry.v[self.registry.index[self.ID]].tolist()
+
+    @v.setter
+    def v(self, v):
+        if self.registry is None: self._v = v
+        else: self.registry.v[self.registry.index[self.ID]] = v
+
+    # From here on s and v are the mass's row in registry
+    def attach(self, registry):
+        self.registry = registry
+        self.__dict__.pop("_s", None)
+        self.__dict__.pop("_v", None)
+
+    # Keeps the last state from the registry once the mass has been removed from it
+    def detach(self):
+        s, v = self.s, self.v
+        self.registry = None
+        self.s, self.v = s, v
         
     def assertions(self,m,v):
         if m > 10**32: m=10**32
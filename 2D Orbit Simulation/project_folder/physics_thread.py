@@ -0,0 +1,85 @@
+import time
+import queue
+import threading
+import numpy as np
+from mass import Mass
+from recorder import snapshot
+
+"""
+Runs the physics in a thread of its own, so a slow step no longer holds up the window
+and a slow frame no longer holds up the physics. The thread calls advance(Model_System)
+rate times a second (as fast as it can if rate is None) and after each call publishes a
+snapshot of every mass (recorder.BODY records) with the simulated and wall time it was
+taken at, and the row of the center object in it (found through the registry's index). Only the two latest snapshots are kept and each is replaced whole, never
+written into, so the render loop can read them while the next step is computed and
+interpolate between them at whatever frame rate it likes.
+New masses asked for by the render loop are queued with spawn, and made and added to
+current_system by the thread between steps, so only the thread ever touches the model
+(or Mass.id). """
+
+class Physics_Thread(threading.Thread):
+    def __init__(self, Model_System, advance, rate=None):
+        super().__init__(daemon=True)
+        self.Model_System, self.advance, self.rate = Model_System, advance, rate
+        self.spawned = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.running, self.error, self.steps = True, None, 0
+        self.publish()
+
+    # Row of the mass with center_object_ID, or None
+    def center_row(self):
+        ID = self.Model_System.main.center_object_ID
+        if ID is None: return None
+        registry = getattr(self.Model_System, "registry", None)
+        if registry is not None: return registry.index.get(ID)
+        return next((k for k, n in enumerate(self.Model_System.current_system) if n.ID == ID), None)
+
+    def publish(self):
+        latest = (self.Model_System.main.time_elapsed, time.perf_counter(), snapshot(self.Model_System),
+                  self.center_row())
+        with self.lock:
+            self.previous, self.latest = getattr(self, "latest", latest), latest
+
+    def run(self):
+        try:
+            next_step = time.perf_counter()
+            while self.running:
+                while not self.spawned.empty():
+                    self.Model_System.current_system.append(Mass(**self.spawned.get()))
+                self.advance(self.Model_System)
+                self.steps += 1
+                self.publish()
+                if self.rate:
+                    # Behind by more than a step: drop the backlog rather than race to catch up
+                    next_step = max(next_step + 1/self.rate, time.perf_counter() - 1/self.rate)
+                    time.sleep(max(next_step - time.perf_counter(), 0))
+        except Exception as error:
+            self.error = error
+
+    # Adds a Mass made from these keyword arguments before the next step
+    def spawn(self, **kwargs):
+        self.spawned.put(kwargs)
+
+    # Position and velocity of the mass with this ID at the latest step, or None
+    def state(self, ID):
+        bodies = self.latest[2]
+        row = np.flatnonzero(bodies["ID"] == ID)
+        if len(row) == 0: return None
+        return bodies["s"][row[0]].tolist(), bodies["v"][row[0]].tolist()
+
+    # The masses as they were one step ago plus however much of the latest step has passed
+    # since it was published. Where the masses changed in that step (a merger or a new mass)
+    # there is nothing to interpolate between and the latest positions are used as they are.
+    # The last is the center object's row, or None.
+    def interpolated(self):
+        with self.lock:
+            (_, wall0, before, _), (_, wall1, after, center) = self.previous, self.latest
+        if wall1 <= wall0 or len(before) != len(after) or np.any(before["ID"] != after["ID"]):
+            return after["ID"], after["s"], after["D"], after["m"], after["colour"], center
+        alpha = min((time.perf_counter() - wall1)/(wall1 - wall0), 1)
+        return after["ID"], before["s"] + alpha*(after["s"] - before["s"]), after["D"], after["m"], \
+               after["colour"], center
+
+    def stop(self):
+        self.running = False
+        if self.is_alive(): self.join()
@@ -0,0 +1,73 @@
+import time
+import json
+import numpy as np
+
+"""
+Times each phase of a step (the nine Gravitation phases run by Main.update_position, and
+the conservation check when a monitor is attached) and any other stage handed to time,
+such as the events and drawing of Main.main, with time.perf_counter_ns. The last window
+times of every stage are kept in a ring buffer, so the percentiles describe the run as it
+is now rather than averaged over its whole history. summary gives the count, mean, p50,
+p95 and p99 of each stage in microseconds and its share of all the time measured since
+the start, and report the same as a table. The physics thread's phases and the render
+loop's stages run side by side, so their shares add up to more than either's wall time.
+Nothing here is called while no profiler is attached: Main and step only check whether
+one is, once a step and once a frame. """
+
+PHASES = ("mass_network", "get_neighbours", "r_vectors", "R_mag", "assymilate",
+          "g_vectors", "resultant_g", "calc_velocity", "reposition")
+
+
+class Stage_Profiler:
+    def __init__(self, window=1024):
+        self.window = window
+        self.samples, self.counts, self.totals = {}, {}, {}
+
+    def add(self, stage, ns):
+        if stage not in self.samples:
+            self.samples[stage] = np.zeros(self.window, dtype=np.int64)
+            self.counts[stage], self.totals[stage] = 0, 0
+        self.samples[stage][self.counts[stage] % self.window] = ns
+        self.counts[stage] += 1
+        self.totals[stage] += ns
+
+    # Calls function(*args, **kwargs) and adds how long it took to stage
+    def time(self, stage, function, *args, **kwargs):
+        start = time.perf_counter_ns()
+        result = function(*args, **kwargs)
+        self.add(stage, time.perf_counter_ns() - start)
+        return result
+
+    # One step of Model_System, as Main.update_position runs it, with every phase timed
+    def step(self, Model_System):
+        for phase in PHASES:
+            self.time(phase, getattr(Model_System, phase))
+            if phase == "resultant_g" and Model_System.monitor is not None:
+                self.time("monitor", Model_System.monitor.observe, Model_System)
+
+    def summary(self):
+        stages = {}
+        total = sum(self.totals.values()) or 1
+        for stage in list(self.samples):
+            count = self.counts[stage]
+            recent = self.samples[stage][:min(count, self.window)]/1000
+            p50, p95, p99 = np.percentile(recent, [50, 95, 99])
+            stages[stage] = {"count": count, "mean_us": float(recent.mean()), "p50_us": float(p50),
+                             "p95_us": float(p95), "p99_us": float(p99),
+                             "share": self.totals[stage]/total}
+        return stages
+
+    def report(self):
+        lines = [f"{'stage':<16}{'count':>10}{'mean us':>12}{'p50 us':>12}{'p95 us':>12}{'p99 us':>12}{'share':>8}"]
+        for stage, s in self.summary().items():
+            lines.append(f"{stage:<16}{s['count']:>10}{s['mean_us']:>12.1f}{s['p50_us']:>12.1f}"
+                         f"{s['p95_us']:>12.1f}{s['p99_us']:>12.1f}{s['share']:>8.1%}")
+        return "\n".join(lines)
+
+    # Prints the report, or writes the summary to path as JSON
+    def dump(self, path=None):
+        if path is None:
+            print(self.report(), flush=True)
+            return
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=1)
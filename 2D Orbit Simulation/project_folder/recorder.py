@@ -0,0 +1,116 @@
+import os
+import json
+import numpy as np
+
+"""
+Trajectory recording for review without re-running the physics. A recording is a
+directory of three files:
+    bodies.bin    every recorded frame's masses back to back, as BODY records
+    frames.bin    one FRAME record per frame: its time and where its masses are in bodies.bin
+    events.jsonl  one line per merge: time, the new mass's ID and the IDs it was made from
+Each frame is a full copy of the state, so every frame is a keyframe and any one can be
+read on its own. Recorder writes bodies.bin through a memory map, which grows by doubling,
+and Trajectory maps the files read-only so a frame is a view into the file, not a copy.
+A recording can be replayed while it is still being written. """
+
+BODY = np.dtype([("ID", "<i8"), ("m", "<f8"), ("s", "<f8", 2), ("v", "<f8", 2),
+                 ("D", "<f8"), ("colour", "u1", 3)])
+FRAME = np.dtype([("time", "<f8"), ("start", "<i8"), ("count", "<i8")])
+
+
+# The state of every mass in a model as BODY records
+def snapshot(Model_System):
+    registry = getattr(Model_System, "registry", None)
+    if registry is not None:
+        bodies = np.empty(len(registry), dtype=BODY)
+        bodies["ID"], bodies["m"], bodies["s"], bodies["v"] = registry.ID, registry.m, registry.s, registry.v
+        bodies["D"], bodies["colour"] = registry.D, registry.colour
+        return bodies
+    system = Model_System.current_system
+    bodies = np.empty(len(system), dtype=BODY)
+    for k, n in enumerate(system):
+        bodies[k] = (n.ID, n.m, n.s, n.v, n.real_diameter, n.colour)
+    return bodies
+
+
+class Recorder:
+    def __init__(self, path, capacity=2**16):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.used, self.capacity = 0, 0
+        self.bodies = None
+        self.bodies_file = os.path.join(path, "bodies.bin")
+        open(self.bodies_file, "wb").close()
+        self.frames = open(os.path.join(path, "frames.bin"), "wb")
+        self.events = open(os.path.join(path, "events.jsonl"), "w")
+        self.merged = 0
+        self.grow(capacity)
+
+    # Remaps bodies.bin with room for at least capacity BODY records
+    def grow(self, capacity):
+        if self.bodies is not None: self.bodies.flush()
+        self.capacity = max(capacity, 2*self.capacity)
+        os.truncate(self.bodies_file, self.capacity*BODY.itemsize)
+        self.bodies = np.memmap(self.bodies_file, dtype=BODY, mode="r+", shape=(self.capacity,))
+
+    def record(self, time, Model_System):
+        bodies = snapshot(Model_System)
+        N = len(bodies)
+        if self.used + N > self.capacity: self.grow(self.used + N)
+        self.bodies[self.used:self.used+N] = bodies
+        self.frames.write(np.array([(time, self.used, N)], dtype=FRAME).tobytes())
+        self.used += N
+        # merged_into only grows, so the entries past the last count are the new merges
+        merged_into = Model_System.merged_into
+        if len(merged_into) != self.merged:
+            into = {}
+            for ID in list(merged_into)[self.merged:]:
+                into.setdefault(merged_into[ID], []).append(ID)
+            for new, old in into.items():
+                self.events.write(json.dumps({"time": time, "into": new, "merged": old}) + "\n")
+            self.merged = len(merged_into)
+
+    # Makes everything recorded so far visible to a Trajectory
+    def flush(self):
+        self.bodies.flush()
+        self.frames.flush()
+        self.events.flush()
+
+    def close(self):
+        self.flush()
+        self.bodies = None
+        os.truncate(self.bodies_file, self.used*BODY.itemsize)
+        self.frames.close()
+        self.events.close()
+
+
+class Trajectory:
+    def __init__(self, path):
+        self.path = path
+        self.reload()
+
+    # Picks up frames written since the last reload
+    def reload(self):
+        self.frames = np.fromfile(os.path.join(self.path, "frames.bin"), dtype=FRAME)
+        size = os.path.getsize(os.path.join(self.path, "bodies.bin"))
+        self.bodies = np.memmap(os.path.join(self.path, "bodies.bin"), dtype=BODY, mode="r",
+                                shape=(size//BODY.itemsize,)) if size else np.zeros(0, dtype=BODY)
+        with open(os.path.join(self.path, "events.jsonl")) as events:
+            self.events = [json.loads(line) for line in events if line.endswith("\n")]
+        self.time = self.frames["time"]
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def duration(self):
+        return self.time[-1] - self.time[0] if len(self.time) else 0
+
+    # The masses of frame k, a read-only view of the file
+    def frame(self, k):
+        start, count = int(self.frames["start"][k]), int(self.frames["count"][k])
+        return self.bodies[start:start+count]
+
+    # Index of the last frame at or before time
+    def seek(self, time):
+        return max(int(np.searchsorted(self.time, time, side="right")) - 1, 0)
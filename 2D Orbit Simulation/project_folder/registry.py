@@ -0,0 +1,50 @@
+import numpy as np
+from mass import *
+
+"""
+Body_Registry keeps the state of every mass in parallel typed arrays, one row per mass,
+with a dict from each mass's ID (its handle) to its row, so finding a mass is O(1).
+Rows are compacted when masses are removed, so the arrays stay contiguous and can be
+handed straight to the force pass. A Mass added to the registry becomes a view of its row.
+serial numbers every row ever added and is never reused, unlike an ID, which a merged
+mass inherits when it swallows the center object. """
+
+class Body_Registry:
+    def __init__(self):
+        self.ID, self.serial = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        self.s, self.v, self.gR = np.zeros((0,2)), np.zeros((0,2)), np.zeros((0,2))
+        self.m, self.D, self.density = np.zeros(0), np.zeros(0), np.zeros(0)
+        self.colour = np.zeros((0,3), dtype=np.uint8)
+        self.index, self.count = {}, 0   # {ID : row}, rows added so far
+
+    def __len__(self):
+        return len(self.ID)
+
+    def reindex(self):
+        self.index = dict(zip(self.ID.tolist(), range(len(self.ID))))
+
+    # Appends a row for each Mass, which from then on reads and writes that row
+    def add(self, masses):
+        N = len(masses)
+        if N == 0: return
+        self.ID = np.append(self.ID, [n.ID for n in masses]).astype(np.int64)
+        self.serial = np.append(self.serial, np.arange(self.count, self.count + N))
+        self.count += N
+        self.s = np.concatenate((self.s, np.array([n.s for n in masses], dtype=np.float64)))
+        self.v = np.concatenate((self.v, np.array([n.v for n in masses], dtype=np.float64)))
+        self.gR = np.concatenate((self.gR, np.zeros((N,2))))
+        self.m = np.append(self.m, np.asarray([n.m for n in masses], dtype=np.float64))
+        self.D = np.append(self.D, np.asarray([n.real_diameter for n in masses], dtype=np.float64))
+        self.density = np.append(self.density, np.asarray([n.avg_density for n in masses], dtype=np.float64))
+        self.colour = np.concatenate((self.colour, np.array([n.colour for n in masses], dtype=np.uint8)))
+        self.reindex()
+        for n in masses: n.attach(self)
+
+    # Drops the given rows. Views of them must be detached first.
+    def remove(self, rows):
+        if len(rows) == 0: return
+        keep = np.ones(len(self.ID), dtype=bool)
+        keep[rows] = False
+        for name in ("ID", "serial", "s", "v", "gR", "m", "D", "density", "colour"):
+            setattr(self, name, getattr(self, name)[keep])
+        self.reindex()
@@ -0,0 +1,89 @@
+import math
+import random
+from mass import *
+
+"""
+Starting systems shared by Main, the headless runner and the benchmarks. Nothing here
+imports pygame. Each function returns a fresh list of Mass instances, so a scenario can
+be run more than once in the same process. """
+
+AU, G = 1.496*10**11, 6.67430*10**-11
+YEAR = 365*24*3600
+
+v_Earth = 29789
+v_Merc = 29789*(1/0.378)**0.5
+v_Ven = 29789*(1/0.72)**0.5
+v_Mar = 29789*(1/1.5)**0.5
+v_Jup = 29789*(1/5.2)**0.5
+v_Sat = 29789*(1/9.5)**0.5
+v_Ura = 29789*(1/19)**0.5
+v_Nep = 29789*(1/30)**0.5
+
+
+def solar_system():
+    return [Mass(m=1.989*10**30, s=[0,0],       v=[0,0],      colour=(255,255,250), avg_density=1408),
+            Mass(m=3.285*10**23, s=[0.378*AU,0],v=[0,v_Merc], colour=(200,180,0),   avg_density=5429),
+            Mass(m=4.867*10**24, s=[0.72*AU,0], v=[0,v_Ven],  colour=(200,180,0),   avg_density=5243),
+            Mass(m=5.972*10**24, s=[AU,0],      v=[0,v_Earth],colour=(80,180,255),  avg_density=5514),
+            Mass(m=6.39*10**23,  s=[1.5*AU,0],  v=[0,v_Mar],  colour=(200,100,50),  avg_density=3934),
+            Mass(m=1.898*10**27, s=[-5.2*AU,0], v=[0,-v_Jup], colour=(200,150,100), avg_density=1326),
+            Mass(m=5.972*10**24, s=[9.5*AU,0],  v=[0,v_Sat],  colour=(150,150,70),  avg_density=687),
+            Mass(m=8.681*10**25, s=[19*AU,0],   v=[0,v_Ura], colour=(0,100,150),   avg_density=1270),
+            Mass(m=1.024*10**26, s=[30*AU,0],  v=[0,-v_Nep], colour=(0,100,255),   avg_density=1638),]
+
+
+# A central star with N-1 lighter masses on roughly circular orbits between 1 and 30 AU
+def random_cluster(N=100, seed=0):
+    rng = random.Random(seed)
+    M_star = 1.989*10**30
+    system = [Mass(m=M_star, s=[0,0], v=[0,0], colour=(255,255,250), avg_density=1408)]
+    for _ in range(N-1):
+        r = rng.uniform(1, 30)*AU
+        angle = rng.uniform(0, 2*math.pi)
+        v = (G*M_star/r)**0.5
+        system.append(Mass(m=rng.uniform(10**22, 10**25),
+                           s=[r*math.cos(angle), r*math.sin(angle)],
+                           v=[-v*math.sin(angle), v*math.cos(angle)],
+                           colour=(200,180,0), avg_density=3000))
+    return system
+
+
+# The solar system with each mass and speed scaled by up to +/- jitter, plus a number of
+# intruders: heavy masses falling in from between 40 and 60 AU. IDs follow solar_system().
+def perturbed_solar_system(seed=0, mass_jitter=0.01, velocity_jitter=0.01, intruders=0):
+    rng = random.Random(seed)
+    system = solar_system()
+    for n in system:
+        n.m *= 1 + rng.uniform(-mass_jitter, mass_jitter)
+        f = 1 + rng.uniform(-velocity_jitter, velocity_jitter)
+        n.v = [n.v[0]*f, n.v[1]*f]
+        n.initialise_data_structures()
+    for _ in range(intruders):
+        r, angle = rng.uniform(40, 60)*AU, rng.uniform(0, 2*math.pi)
+        aim = angle + math.pi + rng.uniform(-0.3, 0.3)
+        v = rng.uniform(1000, 5000)
+        system.append(Mass(m=rng.uniform(10**27, 10**29),
+                           s=[r*math.cos(angle), r*math.sin(angle)],
+                           v=[v*math.cos(aim), v*math.sin(aim)],
+                           colour=(255,70,110), avg_density=1400))
+    return system
+
+
+# A cold, diffuse cloud of N masses scattered over a disc of the given radius with little
+# random motion, which falls in on itself and merges most of the way down to a handful of
+# masses within a few hundred steps of the default time_step
+def collapse(N=200, seed=0, radius=AU, m=6*10**28, density=1, speed=1000):
+    rng = random.Random(seed)
+    system = []
+    for _ in range(N):
+        r, angle = radius*rng.random()**0.5, rng.uniform(0, 2*math.pi)
+        v, heading = speed*rng.random(), rng.uniform(0, 2*math.pi)
+        system.append(Mass(m=m*rng.uniform(0.5, 1.5),
+                           s=[r*math.cos(angle), r*math.sin(angle)],
+                           v=[v*math.cos(heading), v*math.sin(heading)],
+                           colour=(255,70,110), avg_density=density))
+    return system
+
+
+SCENARIOS = {"solar_system": solar_system, "random_cluster": random_cluster,
+             "perturbed_solar_system": perturbed_solar_system, "collapse": collapse}